@@ -0,0 +1,166 @@
+"""
+Module to keep statistics of the scores of every stored user. Scores
+are read from storage once into a NumPy matrix and the statistics are
+then kept up to date as results are stored or deleted
+"""
+
+# Imported library dependencies from the standard library
+import threading
+
+# Imported library dependencies from third party sources
+import numpy as np
+
+# Custom imports developed for the application
+import storage
+
+# Columns C to O of a co2_scores row, the results and the final score
+SCORE_COLUMNS = slice(2, 3 + storage.NUM_OF_RESULTS)
+
+# Percentiles reported by the command line summary
+REPORT_PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def score_matrix(rows):
+    """
+    Return columns C to O of stored rows as an integer matrix with a
+    row per user, skipping the header and any incomplete rows
+    """
+    scores = []
+    for row in rows:
+        values = row[SCORE_COLUMNS]
+        if len(values) != storage.NUM_OF_RESULTS + 1:
+            continue
+        try:
+            scores.append([int(value) for value in values])
+        except ValueError:
+            continue
+    return np.array(scores, dtype=np.int64).reshape(
+        -1, storage.NUM_OF_RESULTS + 1)
+
+
+def ordinal(number):
+    """
+    Return a number with its ordinal suffix such as 1st or 12th
+    """
+    suffix = {1: "st", 2: "nd", 3: "rd"}.get(number % 10, "th")
+    if number % 100 in (11, 12, 13):
+        suffix = "th"
+    return f"{number}{suffix}"
+
+
+class CohortStats:
+    """
+    Creates running statistics of stored scores: the sum of each
+    column for means and a histogram of final scores for percentiles.
+    Final scores are whole numbers in a small range so the histogram
+    is exact and adding or removing a result only changes one bin
+    """
+    def __init__(self, scores=None):
+        self.lock = threading.Lock()
+        if scores is None:
+            scores = score_matrix([])
+        self.count = len(scores)
+        self.sums = scores.sum(axis=0)
+        self.histogram = np.bincount(np.maximum(scores[:, -1], 0))
+
+    def adjust(self, row, step):
+        """
+        Add a row of results and final score to the statistics,
+        or remove it with a step of -1
+        """
+        total = max(int(row[-1]), 0)
+        with self.lock:
+            if total >= len(self.histogram):
+                self.histogram = np.concatenate(
+                    (self.histogram,
+                     np.zeros(total + 1 - len(self.histogram), np.int64)))
+            self.count += step
+            self.sums += step * np.asarray(row, dtype=np.int64)
+            self.histogram[total] += step
+
+    def add(self, row):
+        """
+        Add a stored row of results and final score
+        """
+        self.adjust(row, 1)
+
+    def remove(self, row):
+        """
+        Remove a row of results and final score that is
+        no longer stored
+        """
+        self.adjust(row, -1)
+
+    def means(self):
+        """
+        Return the mean of each result and of the final score
+        """
+        with self.lock:
+            if self.count == 0:
+                return None
+            return self.sums / self.count
+
+    def percentile_rank(self, total, exclude=None):
+        """
+        Return the percentage of stored final scores below the total,
+        counting scores equal to it as half below, or None if no
+        scores are stored. A stored final score to exclude, such as
+        the user's own previous score, is left out of the ranking
+        """
+        with self.lock:
+            total = max(int(total), 0)
+            count = self.count
+            below = self.histogram[:total].sum()
+            equal = (self.histogram[total]
+                     if total < len(self.histogram) else 0)
+            if exclude is not None:
+                exclude = max(int(exclude), 0)
+                count -= 1
+                if exclude < total:
+                    below -= 1
+                elif exclude == total:
+                    equal -= 1
+            if count <= 0:
+                return None
+            return int(round(100 * (below + equal / 2) / count))
+
+    def percentile(self, percent):
+        """
+        Return the final score at or below which the percentage of
+        stored scores fall, or None if no scores are stored
+        """
+        with self.lock:
+            if self.count == 0:
+                return None
+            cumulative = np.cumsum(self.histogram)
+            return int(np.searchsorted(cumulative,
+                                       percent / 100 * self.count))
+
+
+def load_cohort(co2_storage):
+    """
+    Return the statistics of every user held in storage, read
+    in a single pass
+    """
+    return CohortStats(score_matrix(co2_storage.all_users()))
+
+
+def main():
+    """
+    Print the statistics of the users in the configured storage
+    """
+    cohort = load_cohort(storage.open_storage())
+    means = cohort.means()
+    if means is None:
+        print("No stored scores")
+        return
+    print(f"{cohort.count} stored scores, mean final score {means[-1]:.1f}")
+    print("Mean result per question: "
+          + ", ".join(f"{mean:.1f}" for mean in means[:-1]))
+    print("Final score percentiles: " + ", ".join(
+        f"{ordinal(percent)} {cohort.percentile(percent)}"
+        for percent in REPORT_PERCENTILES))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Micro-benchmark of drawing a bar chart, comparing the cell by cell
+string building it replaced with bars sliced from segments uncached
+and cached. Checks the bars are byte-identical first
+
+Run from the repository root with: python benchmarks/bench_bar.py
+"""
+
+# Imported library dependencies from the standard library
+import functools
+import math
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+# Custom imports developed for the application
+import gui  # noqa: E402
+import questionnaire  # noqa: E402
+
+# Max scores of single questions and of whole questionnaires
+MAX_SCORES = (14, 15, 55, 56, 180, 240)
+
+
+def cell_by_cell_bar(score, max_score, row):
+    """
+    The previous bar chart string built with += one cell at a time
+    """
+    max_score_scaled = max_score / 4 if int(max_score) > 55 else max_score
+    user_results_scaled = score / 4 if int(max_score) > 55 else score
+    bar_chart_string = f"\033[{row};13H"
+    proportion = math.ceil((55 / int(max_score_scaled)) * user_results_scaled)
+    for i in range(55):
+        if i < proportion:
+            if int(score) > 60:
+                bar_chart_string += "\033[41;31m\u2588"
+            else:
+                bar_chart_string += "\033[42;32m\u2588"
+        elif i == proportion:
+            bar_chart_string += "\033[42;30m\u2588"
+        else:
+            bar_chart_string += "\033[47;30m\u2591"
+    return bar_chart_string
+
+
+def sliced_bar(render, score, max_score, row):
+    """
+    Draw a bar with the segment renderer
+    """
+    proportion = questionnaire.bar_proportion(
+        score, questionnaire.bar_scale(max_score))
+    return render(proportion, score > 60, row)
+
+
+def main():
+    """
+    Check every score draws the same bar then time each renderer
+    """
+    cases = [(score, max_score, row) for max_score in MAX_SCORES
+             for score in range(max_score + 5) for row in (7, 10)]
+    for score, max_score, row in cases:
+        if (cell_by_cell_bar(score, max_score, row)
+                != sliced_bar(gui.render_bar, score, max_score, row)):
+            sys.exit(f"Bars differ for score {score} of {max_score}")
+    print(f"{len(cases)} bars byte-identical")
+
+    def draw_all(function):
+        for case in cases:
+            function(*case)
+
+    renderers = (
+        ("cell by cell", cell_by_cell_bar),
+        ("sliced", functools.partial(sliced_bar, gui.render_bar.__wrapped__)),
+        ("sliced cached", functools.partial(sliced_bar, gui.render_bar)),
+    )
+    for name, function in renderers:
+        timer = timeit.Timer(functools.partial(draw_all, function))
+        number, _ = timer.autorange()
+        best = min(timer.repeat(5, number)) / number / len(cases)
+        print(f"{name:>14}: {best * 1e6:8.3f} us per bar")
+
+
+if __name__ == "__main__":
+    main()
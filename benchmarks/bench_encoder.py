@@ -0,0 +1,52 @@
+"""
+Benchmark comparing the per pixel and run length background encoders
+for every image in assets/images
+
+Run from the repository root with: python benchmarks/bench_encoder.py
+"""
+
+# Imported library dependencies from the standard library
+import glob
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+# Custom imports developed for the application
+import gui  # noqa: E402
+
+REPEATS = 200
+
+
+def bench_image(image_name):
+    """
+    Time both encoders over one image and return the table row
+    """
+    indices = gui.open_image(image_name).indices
+    row = [os.path.basename(image_name)]
+    for encoder in (gui.encode_frame_cells, gui.encode_frame_rle):
+        frame = encoder(indices)
+        seconds = timeit.timeit(lambda enc=encoder: enc(indices),
+                                number=REPEATS) / REPEATS
+        row += [len(frame.encode("utf-8")), seconds * 1e6]
+    return row
+
+
+def main():
+    """
+    Print a table of output bytes and build time for each encoder
+    """
+    print(f"{'image':<22}{'cells B':>10}{'cells us':>10}"
+          f"{'rle B':>10}{'rle us':>10}{'saving':>9}")
+    for image_name in sorted(glob.glob("assets/images/*.bmp")):
+        name, cells_bytes, cells_us, rle_bytes, rle_us = bench_image(
+            image_name)
+        saving = 1 - rle_bytes / cells_bytes
+        print(f"{name:<22}{cells_bytes:>10}{cells_us:>10.1f}"
+              f"{rle_bytes:>10}{rle_us:>10.1f}{saving:>9.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Benchmark of terminal output per questionnaire session, counting the
+write system calls and bytes sent to a pipe standing in for the
+terminal against the print calls the screens make
+
+Run from the repository root with: python benchmarks/bench_output.py
+"""
+
+# Imported library dependencies from the standard library
+import contextvars
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Fixtures shared by the benchmarks
+from fixtures import (NUM_QUESTIONS, OPTION_SCORES,  # noqa: E402
+                      questionnaire_rows)
+
+SESSIONS = 50
+
+
+def session_script():
+    """
+    Return the lines a new user types to answer every question and
+    store their results
+    """
+    answers = []
+    for question_num in range(NUM_QUESTIONS):
+        answers += [str(question_num % len(OPTION_SCORES) + 1), ""]
+    return ["2", ""] + answers + ["", "y", ""]
+
+
+def drain(read_fd):
+    """
+    Read the pipe until it is closed, as the terminal would
+    """
+    while os.read(read_fd, 65536):
+        pass
+
+
+def main():
+    """
+    Run scripted sessions writing to a pipe and print the counts
+    """
+    work_dir = tempfile.mkdtemp()
+    os.chdir(work_dir)
+    os.environ["CO2_STORAGE"] = "sqlite:" + os.path.join(work_dir, "bench.db")
+
+    # Imported here so storage and the questionnaire are local
+    # pylint: disable=import-outside-toplevel
+    import storage
+    storage.SQLiteStorage(os.path.join(work_dir, "bench.db")
+                          ).set_questionnaire_rows(questionnaire_rows())
+    import gui
+    import run
+
+    counts = {"write": 0, "bytes": 0, "print": 0, "flush": 0}
+    real_write = os.write
+    real_print = gui.ScreenBuffer.print
+    real_flush = gui.ScreenBuffer.flush
+
+    def counted_write(descriptor, data):
+        written = real_write(descriptor, data)
+        # Other files, such as the score history, are not counted
+        if descriptor == write_fd:
+            counts["write"] += 1
+            counts["bytes"] += written
+        return written
+
+    def counted_print(self, *values, **kwargs):
+        counts["print"] += 1
+        return real_print(self, *values, **kwargs)
+
+    def counted_flush(self):
+        counts["flush"] += 1
+        return real_flush(self)
+
+    read_fd, write_fd = os.pipe()
+    drainer = threading.Thread(target=drain, args=(read_fd,))
+    drainer.start()
+    terminal = os.fdopen(write_fd, "w", encoding="utf-8")
+
+    def session():
+        lines = iter(session_script())
+
+        def read_line():
+            try:
+                return next(lines)
+            except StopIteration:
+                raise EOFError from None
+
+        gui.current_screen.set(gui.ScreenBuffer(stream=terminal,
+                                                read_line=read_line))
+        try:
+            run.run_session((run.main_menu, None))
+        except EOFError:
+            pass
+
+    # The first session loads the questionnaire and warms the caches
+    contextvars.copy_context().run(session)
+    os.write = counted_write
+    gui.ScreenBuffer.print = counted_print
+    gui.ScreenBuffer.flush = counted_flush
+    started = time.perf_counter()
+    try:
+        for _ in range(SESSIONS):
+            contextvars.copy_context().run(session)
+    finally:
+        os.write = real_write
+        gui.ScreenBuffer.print = real_print
+        gui.ScreenBuffer.flush = real_flush
+        seconds = time.perf_counter() - started
+        terminal.close()
+        drainer.join()
+    run.STORAGE.flush()
+
+    print(f"{SESSIONS} sessions of {NUM_QUESTIONS} questions, "
+          f"{seconds / SESSIONS * 1e3:.2f} ms per session")
+    for name, label in (("print", "print calls"), ("flush", "screens ready"),
+                        ("write", "write system calls"),
+                        ("bytes", "bytes written")):
+        print(f"{label:>20}: {counts[name] / SESSIONS:10.1f} per session")
+    print(f"{'bytes per write':>20}: "
+          f"{counts['bytes'] / max(counts['write'], 1):10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark running the full questionnaire with scripted answers, from
+the first question to the results screen, and of the per answer score
+lookup against the string parsing it replaced
+
+Run from the repository root with: python benchmarks/bench_questionnaire.py
+"""
+
+# Imported library dependencies from the standard library
+import builtins
+import functools
+import itertools
+import os
+import sys
+import tempfile
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Fixtures shared by the benchmarks
+from fixtures import (NUM_QUESTIONS, OPTION_SCORES, NullStream,  # noqa: E402
+                      questionnaire_rows)
+
+SESSIONS = 200
+
+
+def parsed_lookup(question_rows, answers):
+    """
+    The previous per answer work of parsing the max score and the
+    option score from their worksheet strings
+    """
+    total = 0
+    for (max_cell, score_cells), answer in zip(question_rows, answers):
+        int(max_cell.replace("Max possible score ", ""))
+        total += int(score_cells[answer - 1])
+    return total
+
+
+def table_lookup(questions, answers):
+    """
+    Per answer work with scores held in the Question arrays
+    """
+    total = 0
+    for question, answer in zip(questions, answers):
+        total += question.scores[answer - 1]
+    return total
+
+
+def main():
+    """
+    Time whole scripted questionnaire sessions and the score lookup
+    """
+    work_dir = tempfile.mkdtemp()
+    os.chdir(work_dir)
+    os.environ["CO2_STORAGE"] = "sqlite:" + os.path.join(work_dir, "bench.db")
+
+    # Imported here so storage and the questionnaire are local
+    import storage  # pylint: disable=import-outside-toplevel
+    storage.SQLiteStorage(os.path.join(work_dir, "bench.db")
+                          ).set_questionnaire_rows(questionnaire_rows())
+    import run  # pylint: disable=import-outside-toplevel
+
+    # Each question takes an option then enter after its bar chart,
+    # and the results bar chart takes enter
+    script = []
+    for question_num in range(NUM_QUESTIONS):
+        script += [str(question_num % len(OPTION_SCORES) + 1), ""]
+    script.append("")
+    inputs = itertools.cycle(script)
+
+    def scripted_input(prompt=""):  # pylint: disable=unused-argument
+        return next(inputs)
+
+    def session():
+        _, current_user, max_total = run.question_user(run.initialise_user())
+        run.results(current_user, max_total)
+
+    builtins.input = scripted_input
+    sys.stdout = NullStream()
+    try:
+        session()
+        seconds = timeit.timeit(session, number=SESSIONS)
+    finally:
+        sys.stdout = sys.__stdout__
+    print(f"{SESSIONS} sessions of {NUM_QUESTIONS} questions: "
+          f"{seconds / SESSIONS * 1e3:.2f} ms per session")
+
+    questions = run.questionnaire_details()["questions"]
+    question_rows = [(f"Max possible score {max(OPTION_SCORES)}",
+                      [str(score) for score in OPTION_SCORES])
+                     for _ in questions]
+    answers = [index % len(OPTION_SCORES) + 1
+               for index in range(len(questions))]
+    for name, function, data in (("parsed strings", parsed_lookup,
+                                  question_rows),
+                                 ("score arrays", table_lookup, questions)):
+        timer = timeit.Timer(functools.partial(function, data, answers))
+        number, _ = timer.autorange()
+        best = min(timer.repeat(5, number)) / number
+        print(f"{name:>16}: {best * 1e6:8.2f} us per questionnaire")
+
+
+if __name__ == "__main__":
+    main()
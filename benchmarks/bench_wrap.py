@@ -0,0 +1,85 @@
+"""
+Micro-benchmark of questionnaire text wrapping on long instruction
+texts, comparing the list insert wrapper it replaced with the single
+pass wrapper uncached and cached
+
+Run from the repository root with: python benchmarks/bench_wrap.py
+"""
+
+# Imported library dependencies from the standard library
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+# Custom imports developed for the application
+import questionnaire  # noqa: E402
+
+WORDS = ("carbon footprint household travel flights energy heating "
+         "recycling diet meat vehicle public transport electricity").split()
+
+LENGTHS = (500, 5000, 50000)
+
+
+def list_insert_wrap(string):
+    """
+    The previous wrapper which calls list.insert for every line break
+    """
+    if len(string) <= 70:
+        return string
+    list_string = list(string)
+    ind = 70
+    while len(list_string) > ind:
+        while list_string[ind] != " ":
+            ind -= 1
+        list_string.insert(ind + 1, "\n\033[1C")
+        ind += 69
+    return "".join(list_string)
+
+
+def instruction_text(length):
+    """
+    Return instruction like text of roughly the given length
+    """
+    text = []
+    size = 0
+    while size < length:
+        word = random.choice(WORDS)
+        text.append(word)
+        size += len(word) + 1
+    return " ".join(text)
+
+
+def best_time(function, repeats):
+    """
+    Return the best time in microseconds for one call of a function
+    """
+    return min(timeit.repeat(function, number=repeats, repeat=5)
+               ) / repeats * 1e6
+
+
+def main():
+    """
+    Print a table of wrap times for each text length
+    """
+    random.seed(0)
+    single_pass = questionnaire.string_wrap.__wrapped__
+    print(f"{'chars':>8}{'insert us':>12}{'single us':>12}"
+          f"{'cached us':>12}")
+    for length in LENGTHS:
+        text = instruction_text(length)
+        repeats = max(1, 200000 // length)
+        questionnaire.string_wrap(text)
+        insert_us = best_time(lambda: list_insert_wrap(text), repeats)
+        single_us = best_time(lambda: single_pass(text), repeats)
+        cached_us = best_time(lambda: questionnaire.string_wrap(text),
+                              repeats)
+        print(f"{length:>8}{insert_us:>12.1f}{single_us:>12.1f}"
+              f"{cached_us:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Fixtures shared by the benchmarks: a questionnaire shaped like the
+real one and a stream that discards the screens written to it
+"""
+
+NUM_QUESTIONS = 12
+
+OPTION_SCORES = (15, 10, 5, 2)
+
+
+def questionnaire_rows(num_questions=NUM_QUESTIONS):
+    """
+    Return questionnaire worksheet rows shaped like the real questionnaire
+    """
+    rows = [["Instructions", "Answer each question with the option that "
+             "best describes your lifestyle.", ""]]
+    for question_num in range(1, num_questions + 1):
+        rows.append([f"Question {question_num}",
+                     f"Question {question_num} about the carbon footprint "
+                     "of your household, travel and diet?",
+                     f"Max possible score {max(OPTION_SCORES)}"])
+        for option_num, score in enumerate(OPTION_SCORES, start=1):
+            rows.append([f"Option {option_num}",
+                         f"Option {option_num} for question {question_num}",
+                         str(score)])
+    rows.append(["Summary", "A score of 60 or below is recommended.", ""])
+    return rows
+
+
+class NullStream:
+    """
+    Creates a stream that discards everything written to it
+    """
+    def write(self, text):
+        """
+        Discard the text
+        """
+        return len(text)
+
+    def flush(self):
+        """
+        Nothing to flush
+        """
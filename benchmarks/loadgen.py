@@ -0,0 +1,178 @@
+"""
+Load generator driving scripted questionnaire sessions concurrently
+against the in-process Google Sheets stand-in, reporting p50 and p99
+latency of each kind of Sheets request and of whole sessions
+
+Run from the repository root with: python benchmarks/loadgen.py --help
+"""
+
+# Imported library dependencies from the standard library
+import argparse
+import contextvars
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Fixtures shared by the benchmarks
+from fixtures import (OPTION_SCORES, NullStream,  # noqa: E402
+                      questionnaire_rows)
+
+
+def user_rows(count, num_questions, rng):
+    """
+    Return rows of users with random results
+    """
+    rows = []
+    for num in range(count):
+        results = [rng.choice(OPTION_SCORES) for _ in range(num_questions)]
+        rows.append([f"L{num:04d}", "01-01-2026"] + results
+                    + [str(sum(results))])
+    return rows
+
+
+def session_script(kind, user_id, num_questions, rng):
+    """
+    Return the lines a user types in one session: a new user answering
+    and storing their results, a returning user answering again or a
+    returning user reviewing their previous score
+    """
+    answers = []
+    for _ in range(num_questions):
+        answers += [str(rng.randint(1, len(OPTION_SCORES))), ""]
+    if kind == "new":
+        return ["2", ""] + answers + ["", "y", ""]
+    if kind == "returning":
+        return ["2", user_id] + answers + [""]
+    return ["3", user_id, "1", ""]
+
+
+def percentile(values, percent):
+    """
+    Return the value at the percentile of sorted values
+    """
+    index = min(len(values) - 1, int(len(values) * percent / 100))
+    return values[index]
+
+
+def main():
+    """
+    Seed the stand-in, run the sessions and print the latency report
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=500,
+                        help="users stored before the sessions start")
+    parser.add_argument("--new", type=float, default=0.3,
+                        help="fraction of sessions by new users")
+    parser.add_argument("--review", type=float, default=0.2,
+                        help="fraction of sessions reviewing a score")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds each Sheets request takes")
+    parser.add_argument("--jitter", type=float, default=0.05,
+                        help="extra random seconds per request, at most")
+    parser.add_argument("--quota", type=int,
+                        help="Sheets requests allowed per minute")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    os.chdir(work_dir)
+    os.environ.update({
+        "CO2_STORAGE": "fakesheets",
+        "CO2_FAKE_LATENCY": str(args.latency),
+        "CO2_FAKE_JITTER": str(args.jitter)
+    })
+
+    # Imported here so the application opens the configured stand-in
+    # pylint: disable=import-outside-toplevel
+    import fakesheets
+    import gui
+    import storage
+
+    rng = random.Random(args.seed)
+    num_questions = storage.NUM_OF_RESULTS
+    client = fakesheets.shared_client()
+    seeded = storage.GoogleSheetsStorage(gspread_client=client)
+    seeded.set_questionnaire_rows(questionnaire_rows(num_questions))
+    users = user_rows(args.users, num_questions, rng)
+    seeded.save_users(users)
+
+    import run
+
+    # Quota and failures apply once seeding and application startup
+    # are done, as for a server that has been running for a while
+    run.questionnaire_details()
+    run.cohort_stats()
+    client.quota = args.quota
+    client.failure_rate = args.failure_rate
+    client.reset_stats()
+
+    scripts = []
+    for _ in range(args.sessions):
+        draw = rng.random()
+        kind = ("new" if draw < args.new else "review"
+                if draw < args.new + args.review else "returning")
+        scripts.append(session_script(kind, rng.choice(users)[0],
+                                      num_questions, rng))
+
+    def run_script(script):
+        lines = iter(script)
+
+        def read_line():
+            try:
+                return next(lines)
+            except StopIteration:
+                raise EOFError from None
+
+        gui.current_screen.set(gui.ScreenBuffer(stream=NullStream(),
+                                                read_line=read_line))
+        started = time.perf_counter()
+        try:
+            run.run_session((run.main_menu, None))
+        except EOFError:
+            pass
+        except fakesheets.FakeSheetsError:
+            return None
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        session_times = list(executor.map(
+            lambda script: contextvars.copy_context().run(run_script,
+                                                          script),
+            scripts))
+    # Apply the writes still queued so their requests are measured
+    try:
+        run.STORAGE.flush()
+    except fakesheets.FakeSheetsError:
+        print("Final flush failed, writes left in the journal")
+    elapsed = time.perf_counter() - started
+
+    failed = session_times.count(None)
+    session_times = [seconds for seconds in session_times
+                     if seconds is not None]
+    print(f"{args.sessions} sessions, {args.concurrency} at a time, "
+          f"in {elapsed:.1f}s, {failed} failed")
+    print(f"{'operation':<16}{'requests':>9}{'errors':>8}"
+          f"{'p50 ms':>9}{'p99 ms':>9}")
+    report = dict(client.stats)
+    if session_times:
+        report["session"] = session_times
+    for operation, times in sorted(report.items()):
+        times = sorted(times)
+        print(f"{operation:<16}{len(times):>9}"
+              f"{client.errors.get(operation, 0):>8}"
+              f"{percentile(times, 50) * 1e3:>9.1f}"
+              f"{percentile(times, 99) * 1e3:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
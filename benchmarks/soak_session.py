@@ -0,0 +1,102 @@
+"""
+Soak test driving 100,000 menu transitions through the session state
+machine with scripted input, reporting the call stack depth and live
+object count as it goes. Exits with an error if either keeps growing
+
+Run from the repository root with: python benchmarks/soak_session.py
+"""
+
+# Imported library dependencies from the standard library
+import builtins
+import gc
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Fixtures shared by the benchmarks
+from fixtures import NullStream  # noqa: E402
+
+TRANSITIONS = 100000
+
+# Sample the stack depth and object count this often
+SAMPLE_EVERY = 10000
+
+QUESTIONNAIRE_ROWS = [
+    ["Instructions", "Answer each question with the option that best "
+     "describes your lifestyle.", ""],
+    ["Question 1", "How many people live in your household?",
+     "Max possible score 14"],
+    ["Option 1", "One", "14"],
+    ["Option 2", "Two", "12"],
+    ["Summary", "A score of 60 or below is recommended.", ""]
+]
+
+
+def stack_depth():
+    """
+    Return the number of frames on the call stack
+    """
+    frame = sys._getframe()  # pylint: disable=protected-access
+    depth = 0
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    return depth
+
+
+def main():
+    """
+    Drive the main menu to the instructions and back, and an invalid
+    choice, until the number of transitions is reached
+    """
+    work_dir = tempfile.mkdtemp()
+    os.chdir(work_dir)
+    os.environ["CO2_STORAGE"] = "sqlite:" + os.path.join(work_dir, "soak.db")
+
+    # Imported here so storage and the questionnaire are local
+    import storage  # pylint: disable=import-outside-toplevel
+    storage.SQLiteStorage(os.path.join(work_dir, "soak.db")
+                          ).set_questionnaire_rows(QUESTIONNAIRE_ROWS)
+    import run  # pylint: disable=import-outside-toplevel
+
+    # Main menu -> instructions -> main menu, then an invalid option
+    # which stays on the main menu, so three inputs give two transitions
+    script = ["1", "2", "9", ""]
+    samples = []
+    state = {"inputs": 0}
+
+    def scripted_input(prompt=""):
+        inputs = state["inputs"]
+        cycles, step = divmod(inputs, len(script))
+        transitions = cycles * 2 + min(step, 2)
+        if transitions >= TRANSITIONS:
+            raise EOFError
+        if transitions % SAMPLE_EVERY == 0 and step == 0:
+            samples.append((transitions, stack_depth(),
+                            len(gc.get_objects())))
+        state["inputs"] += 1
+        return script[inputs % len(script)]
+
+    builtins.input = scripted_input
+    sys.stdout = NullStream()
+    try:
+        run.run_session((run.main_menu, None))
+    except EOFError:
+        pass
+    finally:
+        sys.stdout = sys.__stdout__
+
+    print(f"{'transitions':>12}{'stack depth':>13}{'objects':>10}")
+    for transitions, depth, objects in samples:
+        print(f"{transitions:>12}{depth:>13}{objects:>10}")
+    first, last = samples[1], samples[-1]
+    if last[1] > first[1] or last[2] > first[2] * 1.05:
+        sys.exit("Stack depth or live objects grew during the soak")
+    print("Stack depth and live objects stayed flat")
+
+
+if __name__ == "__main__":
+    main()
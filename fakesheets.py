@@ -0,0 +1,403 @@
+"""
+Module providing an in-process stand-in for the parts of gspread used
+by the application, so storage can be exercised and load tested
+without Google Sheets or credentials. Every request can be slowed by a
+simulated latency, limited by a request quota or made to fail
+"""
+
+# Imported library dependencies from the standard library
+import collections
+import os
+import random
+import re
+import threading
+import time
+
+# Matches an A1 range such as "co2_scores!A5:O5", "A1" or "A2:O"
+a1_pattern = re.compile(r"(?:.*!)?([A-Z]+)(\d*)(?::([A-Z]+)(\d*))?$")
+
+# Headings of the co2_scores worksheet
+CO2_SCORES_HEADER = (["user_id", "date"]
+                     + [f"result_{num}" for num in range(1, 13)]
+                     + ["final_score"])
+
+
+class FakeSheetsError(Exception):
+    """
+    Raised for a failed request, as gspread raises APIError
+    """
+
+
+class QuotaExceeded(FakeSheetsError):
+    """
+    Raised when more requests are made than the quota allows,
+    as Google Sheets answers 429
+    """
+
+
+class InjectedFailure(FakeSheetsError):
+    """
+    Raised for a request chosen to fail
+    """
+
+
+class SpreadsheetNotFound(FakeSheetsError):
+    """
+    Raised when opening a spreadsheet that does not exist
+    """
+
+
+class WorksheetNotFound(FakeSheetsError):
+    """
+    Raised when opening a worksheet that does not exist
+    """
+
+
+def column_number(letters):
+    """
+    Return the 1 based number of a column from its letters
+    """
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord("A") + 1
+    return number
+
+
+def column_letters(number):
+    """
+    Return the letters of a 1 based column number
+    """
+    letters = ""
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def parse_range(range_name):
+    """
+    Return the first row, first column, last row and last column of an
+    A1 range, with None for an open ended last row. A single cell is a
+    range of that one cell
+    """
+    match = a1_pattern.match(range_name)
+    if match is None:
+        raise FakeSheetsError(f"Unable to parse range: {range_name}")
+    first_col, first_row, last_col, last_row = match.groups()
+    first_row = int(first_row or 1)
+    if last_col is None:
+        return (first_row, column_number(first_col), first_row,
+                column_number(first_col))
+    return (first_row, column_number(first_col),
+            int(last_row) if last_row else None, column_number(last_col))
+
+
+class Cell:
+    """
+    Creates a cell found in a worksheet
+    """
+    def __init__(self, row, col, value):
+        self.row = row
+        self.col = col
+        self.value = value
+
+
+class FakeClient:
+    """
+    Creates a client holding spreadsheets in memory. Each request waits
+    the latency, plus up to the jitter, counts against a quota of
+    requests per window and fails at the failure rate. The time taken
+    by each kind of request is recorded in stats
+    """
+    def __init__(self, latency=0.0, jitter=0.0, quota=None,
+                 quota_window=60.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.quota = quota
+        self.quota_window = quota_window
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.spreadsheets = {}
+        self.lock = threading.Lock()
+        self.request_times = collections.deque()
+        self.fail_next_requests = 0
+        self.stats = collections.defaultdict(list)
+        self.errors = collections.Counter()
+
+    def create(self, title):
+        """
+        Create an empty spreadsheet
+        """
+        spreadsheet = FakeSpreadsheet(self, title)
+        self.spreadsheets[title] = spreadsheet
+        return spreadsheet
+
+    def open(self, title):
+        """
+        Return the spreadsheet with the title
+        """
+        self.request("open")
+        try:
+            return self.spreadsheets[title]
+        except KeyError:
+            raise SpreadsheetNotFound(title) from None
+
+    def fail_next(self, count=1):
+        """
+        Make the next requests fail
+        """
+        with self.lock:
+            self.fail_next_requests += count
+
+    def reset_stats(self):
+        """
+        Forget the recorded request times and errors
+        """
+        with self.lock:
+            self.stats.clear()
+            self.errors.clear()
+
+    def request(self, operation):
+        """
+        Apply the latency, quota and failure injection to a request
+        """
+        started = time.perf_counter()
+        with self.lock:
+            now = time.monotonic()
+            error = None
+            if self.quota is not None:
+                while (self.request_times
+                       and now - self.request_times[0] > self.quota_window):
+                    self.request_times.popleft()
+                if len(self.request_times) >= self.quota:
+                    error = QuotaExceeded(f"Quota exceeded for {operation}")
+                else:
+                    self.request_times.append(now)
+            if error is None and self.fail_next_requests:
+                self.fail_next_requests -= 1
+                error = InjectedFailure(f"Injected failure of {operation}")
+            elif (error is None and self.failure_rate
+                    and self.random.random() < self.failure_rate):
+                error = InjectedFailure(f"Injected failure of {operation}")
+            delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        with self.lock:
+            self.stats[operation].append(time.perf_counter() - started)
+            if error is not None:
+                self.errors[operation] += 1
+        if error is not None:
+            raise error
+
+
+class FakeSpreadsheet:
+    """
+    Creates a spreadsheet of named worksheets
+    """
+    def __init__(self, client, title):
+        self.client = client
+        self.title = title
+        self.worksheets = {}
+
+    def add_worksheet(self, title, rows=None):
+        """
+        Create a worksheet holding the rows
+        """
+        worksheet = FakeWorksheet(self, title, rows)
+        self.worksheets[title] = worksheet
+        return worksheet
+
+    def worksheet(self, title):
+        """
+        Return the worksheet with the title
+        """
+        self.client.request("worksheet")
+        try:
+            return self.worksheets[title]
+        except KeyError:
+            raise WorksheetNotFound(title) from None
+
+
+class FakeWorksheet:
+    """
+    Creates a worksheet held as a list of rows of strings, with the
+    request methods of a gspread worksheet
+    """
+    def __init__(self, spreadsheet, title, rows=None):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.rows = [[str(value) for value in row] for row in rows or []]
+        self.lock = threading.Lock()
+
+    def request(self, operation):
+        """
+        Pass a request through the client
+        """
+        self.spreadsheet.client.request(operation)
+
+    def cells(self, first_row, first_col, last_row, last_col):
+        """
+        Return the values of a block of cells, trimming empty rows and
+        columns from the end as Google Sheets does
+        """
+        if last_row is None:
+            last_row = len(self.rows)
+        block = [row[first_col - 1:last_col]
+                 for row in self.rows[first_row - 1:last_row]]
+        while block and not any(block[-1]):
+            block.pop()
+        return [row[:max((index + 1 for index, value in enumerate(row)
+                          if value), default=0)] for row in block]
+
+    def write_cells(self, first_row, first_col, values):
+        """
+        Write rows of values starting at a cell
+        """
+        for row_number, row_values in enumerate(values, start=first_row):
+            while len(self.rows) < row_number:
+                self.rows.append([])
+            row = self.rows[row_number - 1]
+            last_col = first_col + len(row_values) - 1
+            row.extend([""] * (last_col - len(row)))
+            row[first_col - 1:last_col] = [str(value)
+                                           for value in row_values]
+
+    def get_all_values(self):
+        """
+        Return every row of the worksheet, padded to the same length
+        """
+        self.request("get_all_values")
+        with self.lock:
+            width = max((len(row) for row in self.rows), default=0)
+            return [row + [""] * (width - len(row)) for row in self.rows]
+
+    def row_values(self, row):
+        """
+        Return the values of a row
+        """
+        self.request("row_values")
+        with self.lock:
+            if row > len(self.rows):
+                return []
+            return list(self.rows[row - 1])
+
+    def find(self, query, in_row=None, in_column=None):
+        """
+        Return the first cell holding the query or None
+        """
+        self.request("find")
+        with self.lock:
+            for row_number, row in enumerate(self.rows, start=1):
+                if in_row is not None and row_number != in_row:
+                    continue
+                for col_number, value in enumerate(row, start=1):
+                    if in_column is not None and col_number != in_column:
+                        continue
+                    if value == query:
+                        return Cell(row_number, col_number, value)
+        return None
+
+    def batch_get(self, ranges):
+        """
+        Return the values of each range
+        """
+        self.request("batch_get")
+        with self.lock:
+            return [self.cells(*parse_range(range_name))
+                    for range_name in ranges]
+
+    def append_row(self, values):
+        """
+        Add a row after the last row holding values
+        """
+        return self.append_rows([values], operation="append_row")
+
+    def append_rows(self, values, operation="append_rows"):
+        """
+        Add rows after the last row holding values, returning the
+        range updated as Google Sheets does
+        """
+        self.request(operation)
+        with self.lock:
+            while self.rows and not any(self.rows[-1]):
+                self.rows.pop()
+            first_row = len(self.rows) + 1
+            self.write_cells(first_row, 1, values)
+            last_col = column_letters(max(len(row) for row in values))
+        last_row = first_row + len(values) - 1
+        return {"updates": {
+            "updatedRange": f"{self.title}!A{first_row}:{last_col}{last_row}",
+            "updatedRows": len(values)
+        }}
+
+    def update(self, range_name, values):
+        """
+        Write rows of values starting at the first cell of the range
+        """
+        self.request("update")
+        first_row, first_col, _, _ = parse_range(range_name)
+        with self.lock:
+            self.write_cells(first_row, first_col, values)
+        return {"updatedRange": range_name}
+
+    def batch_update(self, data):
+        """
+        Write the values of several ranges in one request
+        """
+        self.request("batch_update")
+        with self.lock:
+            for update in data:
+                first_row, first_col, _, _ = parse_range(update["range"])
+                self.write_cells(first_row, first_col, update["values"])
+        return {"totalUpdatedRows": len(data)}
+
+    def delete_rows(self, start_index, end_index=None):
+        """
+        Delete rows from start_index to end_index inclusive
+        """
+        self.request("delete_rows")
+        with self.lock:
+            del self.rows[start_index - 1:end_index or start_index]
+
+    def clear(self):
+        """
+        Remove every value from the worksheet
+        """
+        self.request("clear")
+        with self.lock:
+            self.rows = []
+
+
+def new_co2_client(**settings):
+    """
+    Return a client holding an empty co2_score spreadsheet shaped
+    like the real one
+    """
+    client = FakeClient(**settings)
+    spreadsheet = client.create("co2_score")
+    spreadsheet.add_worksheet("co2_scores", [CO2_SCORES_HEADER])
+    spreadsheet.add_worksheet("questionnaire")
+    return client
+
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+
+def shared_client():
+    """
+    Return the client shared by storage opened in this process, set up
+    from CO2_FAKE_LATENCY and CO2_FAKE_JITTER in seconds, CO2_FAKE_QUOTA
+    in requests per minute and CO2_FAKE_FAILURE_RATE
+    """
+    global _shared_client  # pylint: disable=global-statement
+    with _shared_lock:
+        if _shared_client is None:
+            quota = os.environ.get("CO2_FAKE_QUOTA")
+            _shared_client = new_co2_client(
+                latency=float(os.environ.get("CO2_FAKE_LATENCY", 0)),
+                jitter=float(os.environ.get("CO2_FAKE_JITTER", 0)),
+                quota=int(quota) if quota else None,
+                failure_rate=float(os.environ.get("CO2_FAKE_FAILURE_RATE",
+                                                  0)))
+        return _shared_client
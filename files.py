@@ -0,0 +1,36 @@
+"""
+Module to replace files whole so that readers, including other
+processes, see either the old or the new contents and never a partly
+written file
+"""
+
+# Imported library dependencies from the standard library
+import os
+
+
+def atomic_write(path, write, mode="w", required=True):
+    """
+    Replace the file at path with what write writes to the open file it
+    is passed. The contents are flushed to disk before the file is
+    replaced, so a crash leaves the old or the new file complete.
+    Files that are only a cache are not required: failing to write
+    them, for example on a read only file system, returns False rather
+    than raising
+    """
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    encoding = None if "b" in mode else "utf-8"
+    try:
+        with open(temp_path, mode, encoding=encoding) as temp_file:
+            write(temp_file)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        if required:
+            raise
+        return False
+    return True
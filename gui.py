@@ -2,24 +2,54 @@
 Module to create graphical backdrops
 """
 
+# Imported library dependencies from the standard library
+import contextlib
+import contextvars
+import glob
+import hashlib
+import os
+import re
+import shutil
+import struct
+import sys
+from functools import lru_cache
+
 # Imported library dependencies from third party sources
 from PIL import Image
-from numpy import asarray
+import numpy as np
 from colorama import Fore, Back, Style
 
+# Custom imports developed for the application
+import files
+import instrument
+
 # Map bitmap pixel colours to equivalent escape characters
 # \u2588 fills a whole character cell
 colour_map = {
-    "(0, 0, 0)": "\033[40;30m\u2588",  # black
-    "(255, 0, 0)": "\033[41;31m\u2588",  # red
-    "(0, 255, 0)": "\033[42;32m\u2588",  # green
-    "(255, 255, 0)": "\033[43;33m\u2588",  # yellow
-    "(0, 0, 255)": "\033[44;34m\u2588",  # blue
-    "(255, 0, 255)": "\033[45;35m\u2588",  # magenta
-    "(0, 255, 255)": "\033[46;36m\u2588",  # cyan
-    "(255, 255, 255)": "\033[47;37m\u2588"  # white
+    (0, 0, 0): "\033[40;30m\u2588",  # black
+    (255, 0, 0): "\033[41;31m\u2588",  # red
+    (0, 255, 0): "\033[42;32m\u2588",  # green
+    (255, 255, 0): "\033[43;33m\u2588",  # yellow
+    (0, 0, 255): "\033[44;34m\u2588",  # blue
+    (255, 0, 255): "\033[45;35m\u2588",  # magenta
+    (0, 255, 255): "\033[46;36m\u2588",  # cyan
+    (255, 255, 255): "\033[47;37m\u2588"  # white
 }
 
+# Palette colours in colour map order, images are held as the index of
+# the nearest palette colour of each pixel
+_palette_rgb = np.array(list(colour_map), dtype=np.int32)
+# Each pixel is drawn as two terminal char cells as two cells
+# are roughly square matching bitmap pixel shape
+_palette_cells = np.array([cell * 2 for cell in colour_map.values()],
+                          dtype=object)
+# Colour escape sequences alone, without the filled character cell
+_palette_sgr = [cell[:-1] for cell in colour_map.values()]
+PIXEL_CELLS = "\u2588" * 2
+
+# Bump when the frame encoding changes so stale frames on disk are rebuilt
+FRAME_VERSION = b"2"
+
 # Terminal command to escape character map
 terminal_command = {
     "clear_screen": "\033[2J\033[2;0H",
@@ -31,6 +61,36 @@ terminal_command = {
 }
 
 
+# Matches control sequence introducer escape sequences
+csi_pattern = re.compile(r"\033\[([?0-9;]*)([A-Za-z])")
+
+# Cell style as (foreground, background, bright), None is the default colour
+DEFAULT_STYLE = (None, None, False)
+
+# Terminal size the screens are laid out for, and the smallest size
+# used as text is placed at fixed rows and columns within it
+DEFAULT_COLS = 80
+DEFAULT_ROWS = 24
+
+# Terminal cells across each background image pixel
+PIXEL_WIDTH = 2
+
+# Unchanged cells that are rewritten rather than moving the cursor past them
+MAX_DIFF_GAP = 4
+
+# Bar chart cells, filled red over the recommended score or green under
+# it, a marker cell where the score ends and shaded cells after it.
+# Each cell is the same length so bars are sliced from whole segments
+BAR_WIDTH = 55
+bar_cells = {
+    "over": "\033[41;31m\u2588",
+    "under": "\033[42;32m\u2588",
+    "marker": "\033[42;30m\u2588",
+    "empty": "\033[47;30m\u2591"
+}
+BAR_CELL_LENGTH = len(bar_cells["empty"])
+
+
 title = [
     # Put cursor home for set style and colour else renders in wrong place
     # Title created in ASCII Art generator https://patorjk.com/software/taag/
@@ -53,60 +113,576 @@ title = [
 
 class GuiImage:
     """
-    Creates an instance of a GUI image for reading
+    Creates an instance of a GUI image held as one palette index
+    per pixel
+    """
+    def __init__(self, indices):
+        self.indices = indices
+
+    @property
+    def image_size(self):
+        """
+        Return the width and height of the image in pixels
+        """
+        height, width = self.indices.shape
+        return width, height
+
+
+def apply_sgr(style, params):
+    """
+    Return the cell style resulting from applying select graphic
+    rendition parameters to a style
+    """
+    foreground, background, bright = style
+    for param in params or [0]:
+        if param == 0:
+            foreground, background, bright = DEFAULT_STYLE
+        elif param == 1:
+            bright = True
+        elif param == 22:
+            bright = False
+        elif 30 <= param <= 37:
+            foreground = param
+        elif param == 39:
+            foreground = None
+        elif 40 <= param <= 47:
+            background = param
+        elif param == 49:
+            background = None
+    return (foreground, background, bright)
+
+
+def sgr(style):
+    """
+    Return the escape characters that set the terminal to a cell style
+    """
+    foreground, background, bright = style
+    params = "\033[0"
+    if bright:
+        params += ";1"
+    if foreground is not None:
+        params += f";{foreground}"
+    if background is not None:
+        params += f";{background}"
+    return params + "m"
+
+
+class ScreenBuffer:
+    """
+    Creates a grid of terminal character cells that keeps the last frame
+    drawn to the terminal and writes only the cells that have changed
     """
-    def __init__(self, pixel_array, image_size, image_array):
-        self.pixel_array = pixel_array
-        self.image_size = image_size
-        self.image_array = image_array
+    def __init__(self, rows=DEFAULT_ROWS, cols=DEFAULT_COLS, stream=None,
+                 read_line=None):
+        self.rows = rows
+        self.cols = cols
+        # Where output goes and input comes from, standard output and
+        # input when not given
+        self.stream = stream
+        self.read_line = read_line
+        self.style = DEFAULT_STYLE
+        self.clear_style = DEFAULT_STYLE
+        self.cursor = [0, 0]
+        self.cursor_visible = True
+        self.cells = self.blank_grid(DEFAULT_STYLE)
+        # State of the terminal after the last write, None when unknown
+        self.drawn = None
+        self.drawn_style = None
+        self.drawn_cursor = None
+        self.drawn_cursor_visible = True
+        # Output waiting to be sent with the next flush
+        self.pending = []
+
+    @staticmethod
+    def cell(char, style):
+        """
+        Return a cell, ignoring the foreground of spaces so that blank
+        cells on the same background compare equal
+        """
+        if char == " ":
+            return (char, (None, style[1], False))
+        return (char, style)
+
+    def blank_grid(self, style):
+        """
+        Return a grid of blank cells in the background of a style
+        """
+        blank = self.cell(" ", style)
+        return [[blank] * self.cols for _ in range(self.rows)]
+
+    def write(self, text):
+        """
+        Draw text into the buffer, actioning the escape characters
+        used by the application
+        """
+        position = 0
+        for match in csi_pattern.finditer(text):
+            self.put_text(text[position:match.start()])
+            self.control(match.group(1), match.group(2))
+            position = match.end()
+        self.put_text(text[position:])
+
+    def print(self, *values, sep=" ", end="\n"):
+        """
+        Draw values into the buffer in the same way as print
+        """
+        self.write(sep.join(str(value) for value in values) + end)
+
+    def new_line(self, row):
+        """
+        Return the row below, scrolling the buffer at the bottom
+        """
+        if row + 1 < self.rows:
+            return row + 1
+        self.cells.pop(0)
+        self.cells.append([self.cell(" ", self.style)] * self.cols)
+        return row
+
+    def put_text(self, text):
+        """
+        Draw plain characters into the buffer at the cursor
+        """
+        row, col = self.cursor
+        for char in text:
+            if char == "\n":
+                row = self.new_line(row)
+                col = 0
+            elif char == "\r":
+                col = 0
+            else:
+                # Wrap only when a character is drawn past the last column
+                if col >= self.cols:
+                    row = self.new_line(row)
+                    col = 0
+                self.cells[row][col] = self.cell(char, self.style)
+                col += 1
+        self.cursor = [row, col]
+
+    def control(self, params, command):
+        """
+        Action a control sequence on the buffer
+        """
+        if params.startswith("?"):
+            if params == "?25" and command in "hl":
+                self.cursor_visible = command == "h"
+            return
+        values = [int(value or 0) for value in params.split(";")
+                  ] if params else []
+        if command in "Hf":
+            row = values[0] if values else 1
+            col = values[1] if len(values) > 1 else 1
+            self.cursor = [min(max(row, 1), self.rows) - 1,
+                           min(max(col, 1), self.cols) - 1]
+        elif command == "C":
+            steps = values[0] if values and values[0] else 1
+            self.cursor[1] = min(self.cursor[1] + steps, self.cols - 1)
+        elif command == "J" and values == [2]:
+            self.cells = self.blank_grid(self.style)
+            self.clear_style = self.style
+        elif command == "m":
+            self.style = apply_sgr(self.style, values)
+
+    def render_changes(self, drawn, pen):
+        """
+        Return the escape characters that redraw the cells that differ
+        from the drawn grid along with the resulting terminal style
+        """
+        output = []
+        for row in range(self.rows):
+            new_row = self.cells[row]
+            old_row = drawn[row]
+            if new_row == old_row:
+                continue
+            col = 0
+            while col < self.cols:
+                if new_row[col] == old_row[col]:
+                    col += 1
+                    continue
+                output.append(f"\033[{row + 1};{col + 1}H")
+                # Rewriting a short run of unchanged cells is cheaper
+                # than moving the cursor past them
+                last_change = col
+                scan = col + 1
+                while scan < self.cols and scan - last_change <= MAX_DIFF_GAP:
+                    if new_row[scan] != old_row[scan]:
+                        last_change = scan
+                    scan += 1
+                for char, style in new_row[col:last_change + 1]:
+                    if style != pen:
+                        output.append(sgr(style))
+                        pen = style
+                    output.append(char)
+                col = last_change + 1
+        return "".join(output), pen
+
+    def render(self):
+        """
+        Return the escape characters that bring the terminal
+        up to date with the buffer
+        """
+        # Clearing the screen first is the only option when nothing is
+        # known about the terminal and is often cheaper after a clear
+        clear = sgr(self.clear_style) + "\033[2J"
+        output, pen = self.render_changes(
+            self.blank_grid(self.clear_style), self.clear_style)
+        output = clear + output
+        if self.drawn is not None:
+            changes, changes_pen = self.render_changes(self.drawn,
+                                                       self.drawn_style)
+            if len(changes) <= len(output):
+                output, pen = changes, changes_pen
+        row, col = self.cursor
+        cursor = [row, min(col, self.cols - 1)]
+        if output or cursor != self.drawn_cursor:
+            output += f"\033[{cursor[0] + 1};{cursor[1] + 1}H"
+        if pen != self.style:
+            output += sgr(self.style)
+        if self.cursor_visible != self.drawn_cursor_visible:
+            output += terminal_command[
+                "show_cursor" if self.cursor_visible else "hide_cursor"]
+        return output
+
+    def mark_drawn(self):
+        """
+        Record that the terminal now shows the buffer
+        """
+        self.drawn = [row[:] for row in self.cells]
+        self.drawn_style = self.style
+        row, col = self.cursor
+        self.drawn_cursor = [row, min(col, self.cols - 1)]
+        self.drawn_cursor_visible = self.cursor_visible
+
+    @instrument.timed("screen.flush")
+    def flush(self):
+        """
+        Write the changed cells and any pending output to the terminal
+        together
+        """
+        output = self.render()
+        if output:
+            self.pending.append(output)
+        self.mark_drawn()
+        if self.pending:
+            output = "".join(self.pending)
+            self.pending.clear()
+            instrument.count("screen.characters_written", len(output))
+            self.write_out(output)
+
+    def write_out(self, output):
+        """
+        Send output to the terminal, with a single system call where
+        the stream is a file that takes it all at once
+        """
+        stream = self.stream or sys.stdout
+        try:
+            descriptor = stream.fileno()
+        except (AttributeError, OSError, ValueError):
+            descriptor = None
+        if descriptor is None:
+            stream.write(output)
+            stream.flush()
+            return
+        # Anything printed outside the screen buffer goes first
+        stream.flush()
+        data = memoryview(output.encode("utf-8"))
+        while data:
+            data = data[os.write(descriptor, data):]
+
+    def write_through(self, text):
+        """
+        Queue prepared escape characters to be sent unchanged with the
+        next flush, drawing them into the buffer so it stays in step
+        """
+        output = self.render()
+        if output:
+            self.pending.append(output)
+        self.write(text)
+        self.pending.append(text)
+        self.mark_drawn()
+
+    def input(self, prompt=""):
+        """
+        Draw the prompt, bring the terminal up to date and read
+        a line of user input
+        """
+        self.write(prompt)
+        self.flush()
+        response = self.read_response()
+        # The terminal echoes the response followed by a new line
+        self.write(response + "\n")
+        self.mark_drawn()
+        return response
+
+    @instrument.timed("user.think_time")
+    def read_response(self):
+        """
+        Wait for the user to enter a line
+        """
+        return self.read_line() if self.read_line else input()
+
+    def invalidate(self):
+        """
+        Forget what the terminal shows so the next flush repaints it
+        """
+        self.drawn = None
+
+    def resize(self, cols, rows):
+        """
+        Lay the screen out for a terminal of a new size, blank until
+        the next screen is drawn and repainted in full
+        """
+        self.cols = cols
+        self.rows = rows
+        self.cursor = [min(self.cursor[0], rows - 1),
+                       min(self.cursor[1], cols - 1)]
+        self.cells = self.blank_grid(self.clear_style)
+        self.invalidate()
+
+
+class ScreenProxy:
+    """
+    Stands in for the screen buffer of the current session so that
+    screens drawing to gui.screen reach the right terminal
+    """
+    def __getattr__(self, name):
+        return getattr(current_screen.get(), name)
+
+
+# Screen buffer of the current session, the process terminal by default
+current_screen = contextvars.ContextVar("current_screen",
+                                        default=ScreenBuffer())
+
+# Screen buffer used by all screens of the application
+screen = ScreenProxy()
 
 
 def terminal_control(command):
     """
-    Takes a passed command and prints required
+    Takes a passed command and draws required
     escape character to screen to action the command
     """
-    print(terminal_command[command], end="")
+    screen.write(terminal_command[command])
+
+
+def read_bmp_pixels(image_name):
+    """
+    Return the pixels of an uncompressed 24 or 32 bit bitmap as a
+    read only array of RGB values viewing a memory map of the file,
+    or None for any other kind of image
+    """
+    try:
+        data = np.memmap(image_name, dtype=np.uint8, mode="r")
+    except (OSError, ValueError):
+        return None
+    if data.size < 54 or data[:2].tobytes() != b"BM":
+        return None
+    pixel_offset, = struct.unpack_from("<I", data, 10)
+    header_size, width, height, _, bits, compression = struct.unpack_from(
+        "<IiiHHI", data, 14)
+    if header_size < 40 or bits not in (24, 32) or compression != 0:
+        return None
+    rows = abs(height)
+    # Rows are padded to whole 4 byte words
+    stride = (width * bits + 31) // 32 * 4
+    if width <= 0 or pixel_offset + stride * rows > data.size:
+        return None
+    channels = bits // 8
+    pixels = data[pixel_offset:pixel_offset + stride * rows].reshape(
+        rows, stride)[:, :width * channels].reshape(rows, width, channels)
+    # Pixels are stored blue first and rows bottom up unless the
+    # height is negative
+    pixels = pixels[..., 2::-1]
+    return pixels[::-1] if height > 0 else pixels
 
 
 def open_image(image_name):
     """
-    Opens the requested image for use using the PIL third party library
-    load and size methods and the numpy third party library asarray method
+    Opens the requested image as palette indices, reading bitmaps
+    through a memory map and other images with the PIL third party
+    library
     """
-    with Image.open(image_name) as image:
-        pixel_array = image.load()
-        image_size = image.size
-        image_array = asarray(image)
-    gui_image = GuiImage(pixel_array, image_size, image_array)
-    return gui_image
+    pixels = read_bmp_pixels(image_name)
+    if pixels is None:
+        with Image.open(image_name) as image:
+            pixels = np.asarray(image.convert("RGB"))
+    return GuiImage(palette_indices(pixels))
 
 
-def set_gui_background(requested_background):
+def scale_indices(indices, width, height):
     """
-    Translate bitmap pixels to escape characters and print to screen
+    Resample palette indices to a new width and height, picking the
+    nearest source pixel for every row and column at once
+    """
+    source_height, source_width = indices.shape
+    if (source_width, source_height) == (width, height):
+        return indices
+    rows = np.arange(height) * source_height // height
+    cols = np.arange(width) * source_width // width
+    return indices[np.ix_(rows, cols)]
+
+
+def palette_indices(image_array):
     """
-    image_map = open_image(requested_background)
-    gui_image = ""
-    for pixel_row in range(int(image_map.image_size[1])):
-        for pixel_col in range(int(image_map.image_size[0])):
-            # Run next command twice as two terminal char cells
-            # are roughly square matching bitmap pixel shape
-            gui_image += colour_map[str(image_map.pixel_array
-                                        [pixel_col, pixel_row])] * 2
-            if pixel_col == 39 and pixel_row <= 22:
-                gui_image += "\n"
+    Map every pixel of an image array to the index of the nearest
+    palette colour, returning one byte per pixel
+    """
+    pixels = image_array[..., :3].astype(np.int32)
+    distances = np.square(pixels[..., np.newaxis, :] - _palette_rgb).sum(
+        axis=-1)
+    return distances.argmin(axis=-1).astype(np.uint8)
+
+
+def encode_frame_cells(indices):
+    """
+    Encode palette indices with a full colour escape sequence
+    for every pixel
+    """
+    rows = _palette_cells[indices]
+    return "\n".join("".join(row) for row in rows.tolist())
+
+
+def encode_frame_rle(indices):
+    """
+    Encode palette indices as runs of same colour pixels, only emitting
+    a colour escape sequence where the colour differs from the previous
+    cell, including across the end of a row
+    """
+    height, width = indices.shape
+    flat = indices.ravel()
+    # Runs start where the colour changes and at the start of every row
+    colour_starts = np.flatnonzero(np.diff(flat)) + 1
+    colour_starts = np.concatenate(([0], colour_starts))
+    run_starts = np.union1d(colour_starts, np.arange(0, flat.size, width))
+    run_ends = np.append(run_starts[1:], flat.size)
+    new_colour = np.isin(run_starts, colour_starts)
+    row_end = np.where((run_ends % width == 0) & (run_ends < flat.size),
+                       "\n", "")
+    gui_image = []
+    for start, end, colour, newline in zip(run_starts.tolist(),
+                                           run_ends.tolist(),
+                                           new_colour.tolist(),
+                                           row_end.tolist()):
+        if colour:
+            gui_image.append(_palette_sgr[flat[start]])
+        gui_image.append(PIXEL_CELLS * (end - start))
+        gui_image.append(newline)
+    return "".join(gui_image)
+
+
+def render_frame(indices):
+    """
+    Translate the palette indices of an image to a complete frame of
+    escape characters ready to be written to the terminal in one go
+    """
+    gui_image = encode_frame_rle(indices)
+    # Hide cursor and leave no new line at end
+    return (terminal_command["clear_screen"]
+            + terminal_command["cursor_home"]
+            + terminal_command["hide_cursor"]
+            + gui_image)
+
+
+def frame_path(image_name, digest):
+    """
+    Return the path of the rendered frame stored next to the image
+    """
+    root = os.path.splitext(image_name)[0]
+    return f"{root}.{digest[:16]}.frame"
+
 
-    # Hide cursor and print to screen with no new line at end
-    terminal_control("clear_screen")
-    terminal_control("cursor_home")
-    terminal_control("hide_cursor")
-    print(gui_image, end="")
+@instrument.timed("gui.load_frame")
+@lru_cache(maxsize=16)
+def load_frame(image_name, cols=DEFAULT_COLS, rows=DEFAULT_ROWS):
+    """
+    Return the rendered frame for an image scaled to fill a terminal
+    of cols by rows. Frames for the default terminal size are read from
+    the frame stored on disk when the image content is unchanged and
+    rendered and stored otherwise, frames for other sizes are only
+    kept in memory
+    """
+    if (cols, rows) != (DEFAULT_COLS, DEFAULT_ROWS):
+        return render_frame(scale_indices(open_image(image_name).indices,
+                                          cols // PIXEL_WIDTH, rows))
+    with open(image_name, "rb") as image_file:
+        image_bytes = image_file.read()
+    digest = hashlib.sha256(FRAME_VERSION + image_bytes).hexdigest()
+    cached_path = frame_path(image_name, digest)
+    try:
+        with open(cached_path, "rb") as frame_file:
+            return frame_file.read().decode("utf-8")
+    except OSError:
+        pass
+
+    frame = render_frame(scale_indices(open_image(image_name).indices,
+                                       cols // PIXEL_WIDTH, rows))
+    root = os.path.splitext(image_name)[0]
+    # Frames from previous versions of the image are no longer needed
+    for stale_path in glob.glob(f"{glob.escape(root)}.*.frame"):
+        with contextlib.suppress(OSError):
+            os.remove(stale_path)
+    files.atomic_write(cached_path,
+                       lambda frame_file: frame_file.write(
+                           frame.encode("utf-8")),
+                       "wb", required=False)
+    return frame
+
+
+@lru_cache(maxsize=4)
+def bar_segments(width):
+    """
+    Return each bar chart cell repeated across the width
+    """
+    return {name: cell * width for name, cell in bar_cells.items()}
+
+
+@lru_cache(maxsize=256)
+def render_bar(proportion, over_limit, row, width=BAR_WIDTH, column=13):
+    """
+    Return the escape sequences drawing a bar chart on a row with the
+    proportion of cells filled, sliced from the bar segments
+    """
+    segments = bar_segments(width)
+    filled = min(max(proportion, 0), width)
+    bar = [f"\033[{row};{column}H",
+           segments["over" if over_limit else "under"][
+               :filled * BAR_CELL_LENGTH]]
+    if 0 <= proportion < width:
+        bar.append(bar_cells["marker"])
+        filled += 1
+    bar.append(segments["empty"][:(width - filled) * BAR_CELL_LENGTH])
+    return "".join(bar)
+
+
+def terminal_size():
+    """
+    Return the columns and rows of the terminal standard output is
+    connected to, no smaller than the default size
+    """
+    size = shutil.get_terminal_size((DEFAULT_COLS, DEFAULT_ROWS))
+    return max(size.columns, DEFAULT_COLS), max(size.lines, DEFAULT_ROWS)
+
+
+def layout_width(default_width):
+    """
+    Return a width laid out for the default terminal size widened by
+    the extra columns of the screen
+    """
+    return default_width + screen.cols - DEFAULT_COLS
+
+
+@instrument.timed("gui.set_gui_background")
+def set_gui_background(requested_background):
+    """
+    Write the rendered background frame, scaled to the screen, to screen
+    """
+    screen.write_through(load_frame(requested_background, screen.cols,
+                                    screen.rows))
 
 
+@instrument.timed("gui.app_title")
 def app_title():
     """
-    Define and print the app title to screen
+    Define and draw the app title to screen
     """
     for string in title:
-        print(string)
+        screen.print(string)
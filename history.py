@@ -0,0 +1,264 @@
+"""
+Module to keep every stored result of every user in an append-only
+file of fixed width records, mapped into memory with NumPy. A sidecar
+file holds the record offsets of each user sorted by user id, so a
+user's history is found with a binary search rather than a scan of
+the file, and only records appended since the sidecar was last
+written are scanned.
+
+The layout is row oriented: each record holds all the fields of one
+result next to each other. It is not a columnar store, so reading a
+single field of every record, or one user's records, touches records
+spread across the file rather than one contiguous column
+"""
+
+# Imported library dependencies from the standard library
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# Imported library dependencies from third party sources
+import numpy as np
+
+# Custom imports developed for the application
+import files
+import storage
+
+# One stored result, each field a fixed width column of the record
+RECORD_DTYPE = np.dtype([
+    ("user_id", "S5"),
+    ("date", "S10"),
+    ("results", "<i2", (storage.NUM_OF_RESULTS,)),
+    ("total", "<i2")
+])
+
+# Start of the file, bump the version when the record layout changes
+MAGIC = b"CO2HIST1"
+
+# Total of the record appended when a user deletes their data
+DELETED = -1
+
+HISTORY_PATH = "score_history.bin"
+
+# Offset index entry of the sidecar file, sorted by user id and offset
+INDEX_DTYPE = np.dtype([("user_id", "S5"), ("offset", "<u4")])
+
+# Start of the sidecar file, followed by the inode of the history file
+# it indexes and the number of records it covers
+INDEX_MAGIC = b"CO2HIDX1"
+INDEX_HEADER = np.dtype([("inode", "<u8"), ("count", "<u8")])
+
+# Records appended after the sidecar was written that are scanned
+# before the sidecar is rewritten to cover them
+INDEX_REBUILD = 1024
+
+
+def index_entries(user_ids, first_offset):
+    """
+    Return sidecar entries for consecutive records, sorted by user id
+    and then offset
+    """
+    entries = np.empty(len(user_ids), INDEX_DTYPE)
+    entries["user_id"] = user_ids
+    entries["offset"] = np.arange(first_offset, first_offset + len(user_ids))
+    return entries[np.argsort(entries["user_id"], kind="stable")]
+
+
+def write_index(index_path, inode, entries, count, required=True):
+    """
+    Replace the sidecar file with entries covering count records of
+    the history file with the inode, returning whether it was written
+    """
+    header = np.array([(inode, count)], INDEX_HEADER)
+
+    def write(index_file):
+        index_file.write(INDEX_MAGIC)
+        index_file.write(header.tobytes())
+        index_file.write(entries.tobytes())
+
+    return files.atomic_write(index_path, write, "wb", required=required)
+
+
+class HistoryStore:
+    """
+    Creates an append-only store of results. Records appended by other
+    processes are picked up the next time the store is read
+    """
+    def __init__(self, path=HISTORY_PATH):
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.lock = threading.Lock()
+        self.inode = None
+        self.records = np.empty(0, RECORD_DTYPE)
+        # Sidecar entries and the number of records they cover
+        self.entries = np.empty(0, INDEX_DTYPE)
+        self.indexed = 0
+
+    def load_index(self):
+        """
+        Map the sidecar file if it indexes the current history file,
+        otherwise start with no records indexed
+        """
+        self.entries = np.empty(0, INDEX_DTYPE)
+        self.indexed = 0
+        header_size = len(INDEX_MAGIC) + INDEX_HEADER.itemsize
+        try:
+            with open(self.index_path, "rb") as index_file:
+                head = index_file.read(header_size)
+            size = os.path.getsize(self.index_path)
+        except OSError:
+            return
+        if len(head) < header_size or head[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            return
+        header = np.frombuffer(head[len(INDEX_MAGIC):], INDEX_HEADER)[0]
+        count = int(header["count"])
+        if (int(header["inode"]) != self.inode or count > len(self.records)
+                or size - header_size != count * INDEX_DTYPE.itemsize):
+            return
+        if count:
+            self.entries = np.memmap(self.index_path, INDEX_DTYPE, "r",
+                                     offset=header_size, shape=(count,))
+        self.indexed = count
+
+    def refresh(self):
+        """
+        Map the records in the file and its sidecar index, rewriting
+        the sidecar once enough records have been appended after it.
+        A partly written last record is ignored
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return
+        count = max(stat.st_size - len(MAGIC), 0) // RECORD_DTYPE.itemsize
+        if stat.st_ino == self.inode and count == len(self.records):
+            return
+        with open(self.path, "rb") as history_file:
+            if history_file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{self.path} is not a score history file")
+        if count:
+            self.records = np.memmap(self.path, RECORD_DTYPE, "r",
+                                     offset=len(MAGIC), shape=(count,))
+        else:
+            self.records = np.empty(0, RECORD_DTYPE)
+        if stat.st_ino != self.inode or count - self.indexed > INDEX_REBUILD:
+            self.inode = stat.st_ino
+            self.load_index()
+        if count - self.indexed > INDEX_REBUILD:
+            entries = np.concatenate((self.entries, index_entries(
+                self.records["user_id"][self.indexed:], self.indexed)))
+            # Entries already indexed come first, so a stable sort keeps
+            # each user's offsets in order
+            entries = entries[np.argsort(entries["user_id"], kind="stable")]
+            write_index(self.index_path, self.inode, entries, count,
+                        required=False)
+            self.entries = entries
+            self.indexed = count
+
+    def offsets(self, user_id):
+        """
+        Return the record offsets of a user in the order they were
+        appended
+        """
+        key = user_id.encode("ascii")
+        user_ids = self.entries["user_id"]
+        first = np.searchsorted(user_ids, key, "left")
+        last = np.searchsorted(user_ids, key, "right")
+        tail = np.flatnonzero(self.records["user_id"][self.indexed:] == key)
+        return np.concatenate((self.entries["offset"][first:last]
+                               .astype(np.int64), tail + self.indexed))
+
+    def append(self, user_id, date, results, total):
+        """
+        Append a result to the end of the file
+        """
+        record = np.zeros(1, RECORD_DTYPE)
+        record["user_id"] = user_id.encode("ascii")
+        record["date"] = date.encode("ascii")
+        record["results"] = results
+        record["total"] = total
+        with self.lock:
+            descriptor = os.open(self.path,
+                                 os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+                                 0o600)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(descriptor, fcntl.LOCK_EX)
+                size = os.fstat(descriptor).st_size
+                if size == 0:
+                    os.write(descriptor, MAGIC)
+                else:
+                    # Drop a partly written record left by a crash so
+                    # later records stay aligned
+                    extra = (size - len(MAGIC)) % RECORD_DTYPE.itemsize
+                    if extra:
+                        os.ftruncate(descriptor, size - extra)
+                os.write(descriptor, record.tobytes())
+            finally:
+                os.close(descriptor)
+
+    def delete(self, user_id):
+        """
+        Hide every result of a user appended so far
+        """
+        self.append(user_id, "", [0] * storage.NUM_OF_RESULTS, DELETED)
+
+    def history(self, user_id):
+        """
+        Return the results of a user oldest first as a record array
+        """
+        with self.lock:
+            self.refresh()
+            records = np.array(self.records[self.offsets(user_id)])
+        deleted = np.flatnonzero(records["total"] == DELETED)
+        if len(deleted):
+            records = records[deleted[-1] + 1:]
+        return records
+
+    def compact(self):
+        """
+        Rewrite the file without the results of deleted users. Only
+        run this while no other process is appending to the file
+        """
+        with self.lock:
+            self.refresh()
+            records = np.array(self.records)
+            entries = index_entries(records["user_id"], 0)
+            offsets = entries["offset"].astype(np.int64)
+            keep = np.ones(len(records), dtype=bool)
+            starts = np.flatnonzero(np.concatenate(
+                ([True], entries["user_id"][1:] != entries["user_id"][:-1])))
+            for user_offsets in np.split(offsets, starts[1:]):
+                deleted = np.flatnonzero(
+                    records["total"][user_offsets] == DELETED)
+                if len(deleted):
+                    keep[user_offsets[:deleted[-1] + 1]] = False
+            records = records[keep]
+
+            def write(history_file):
+                history_file.write(MAGIC)
+                history_file.write(records.tobytes())
+
+            files.atomic_write(self.path, write, "wb")
+            write_index(self.index_path, os.stat(self.path).st_ino,
+                        index_entries(records["user_id"], 0), len(records))
+            self.inode = None
+            self.records = np.empty(0, RECORD_DTYPE)
+            removed = len(keep) - len(records)
+        return removed
+
+
+def main():
+    """
+    Remove the results of deleted users from the history file
+    """
+    removed = HistoryStore().compact()
+    print(f"Removed {removed} deleted records from {HISTORY_PATH}")
+
+
+if __name__ == "__main__":
+    main()
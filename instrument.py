@@ -0,0 +1,209 @@
+"""
+Module to time the storage calls, rendering and user think time of
+sessions. Timings are kept as histograms with call and error counters
+and written as Prometheus text to a file at exit or served over HTTP.
+
+Instrumentation is off unless CO2_METRICS_FILE or CO2_METRICS_PORT is
+set when the application starts. When off, functions are left
+unwrapped so there is no cost
+"""
+
+# Imported library dependencies from the standard library
+import atexit
+import bisect
+import functools
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Custom imports developed for the application
+import files
+
+METRICS_FILE = os.environ.get("CO2_METRICS_FILE")
+METRICS_PORT = os.environ.get("CO2_METRICS_PORT")
+ENABLED = bool(METRICS_FILE or METRICS_PORT)
+
+# Upper bounds in seconds of the histogram buckets, the last bucket
+# holds everything slower
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Storage methods timed by instrument_storage
+STORAGE_METHODS = ("questionnaire_rows", "find_user", "user_exists",
+                   "count_users", "all_users", "add_user", "update_user",
+                   "save_users", "delete_user")
+
+
+class Histogram:
+    """
+    Creates a latency histogram with a count of the calls that raised
+    """
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.errors = 0
+
+    def observe(self, seconds, failed=False):
+        """
+        Record one call
+        """
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        if failed:
+            self.errors += 1
+
+
+class Registry:
+    """
+    Creates a thread safe collection of named histograms and counters
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, seconds, failed=False):
+        """
+        Record one timed call of the named operation
+        """
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds, failed)
+
+    def count(self, name, amount=1):
+        """
+        Add to the named counter
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def exposition(self):
+        """
+        Return the metrics in the Prometheus text exposition format
+        """
+        lines = ["# HELP co2_call_seconds Time taken by instrumented calls",
+                 "# TYPE co2_call_seconds histogram"]
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+            errors = []
+            for name, histogram in histograms:
+                cumulative = 0
+                for bound, bucket in zip(BUCKETS + ("+Inf",),
+                                         histogram.buckets):
+                    cumulative += bucket
+                    lines.append(f'co2_call_seconds_bucket{{name="{name}",'
+                                 f'le="{bound}"}} {cumulative}')
+                lines.append(f'co2_call_seconds_sum{{name="{name}"}} '
+                             f'{histogram.total:.6f}')
+                lines.append(f'co2_call_seconds_count{{name="{name}"}} '
+                             f'{histogram.count}')
+                errors.append(f'co2_call_errors_total{{name="{name}"}} '
+                              f'{histogram.errors}')
+        lines += ["# HELP co2_call_errors_total Instrumented calls that "
+                  "raised", "# TYPE co2_call_errors_total counter"] + errors
+        lines += ["# HELP co2_events_total Counted events",
+                  "# TYPE co2_events_total counter"]
+        lines += [f'co2_events_total{{name="{name}"}} {value}'
+                  for name, value in counters]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def timed(name):
+    """
+    Return a decorator recording the time of each call of a function
+    under the name, or leaving the function as it is when disabled
+    """
+    def decorator(function):
+        if not ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            failed = True
+            try:
+                result = function(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                registry.observe(name, time.perf_counter() - started, failed)
+        return wrapper
+    return decorator
+
+
+def count(name, amount=1):
+    """
+    Add to the named counter when enabled
+    """
+    if ENABLED:
+        registry.count(name, amount)
+
+
+def instrument_storage(co2_storage, prefix):
+    """
+    Time the storage methods of a storage instance under the prefix,
+    returning the instance
+    """
+    if ENABLED:
+        for method in STORAGE_METHODS:
+            setattr(co2_storage, method,
+                    timed(f"{prefix}.{method}")(getattr(co2_storage,
+                                                        method)))
+    return co2_storage
+
+
+def write_metrics(path=METRICS_FILE):
+    """
+    Write the metrics to a file
+    """
+    exposition = registry.exposition()
+    files.atomic_write(path, lambda metrics_file: metrics_file.write(
+        exposition))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serves the metrics at /metrics
+    """
+    def do_GET(self):  # pylint: disable=invalid-name
+        """
+        Answer a request for the metrics
+        """
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.exposition().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """
+        Requests are not logged to the terminal
+        """
+
+
+def serve_metrics(port):
+    """
+    Serve the metrics over HTTP on localhost from a daemon thread
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if METRICS_FILE:
+    atexit.register(write_metrics)
+if METRICS_PORT:
+    serve_metrics(int(METRICS_PORT))
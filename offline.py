@@ -0,0 +1,305 @@
+"""
+Module to run sessions against a local replica of the questionnaire and
+co2_scores worksheets so users never wait on the network. Writes are
+applied to the replica and recorded in a mutation log, which a
+background worker syncs to the remote storage in batches whenever it
+can be reached, pulling remote changes back into the replica
+"""
+
+# Imported library dependencies from the standard library
+import atexit
+import json
+import threading
+import time
+from datetime import datetime
+
+# Custom imports developed for the application
+import storage
+import write_behind
+
+# Local database holding the replica and the mutation log
+REPLICA_PATH = "offline_replica.db"
+
+# Seconds between syncs with the remote storage
+SYNC_INTERVAL = 5
+
+# Values in a co2_scores row
+ROW_LENGTH = storage.NUM_OF_RESULTS + 3
+
+
+def row_strings(row):
+    """
+    Return a row as strings, padded or trimmed to a full co2_scores row
+    """
+    return ([str(value) for value in row] + [""] * ROW_LENGTH)[:ROW_LENGTH]
+
+
+def row_time(row):
+    """
+    Return the timestamp of the start of the day a row was stored on,
+    or 0 when the date cannot be read
+    """
+    try:
+        return datetime.strptime(row[1], "%d-%m-%Y").timestamp()
+    except (IndexError, ValueError):
+        return 0.0
+
+
+class OfflineStorage(storage.Storage):
+    """
+    Creates storage that reads from and writes to a local replica,
+    syncing with the storage returned by open_remote from a background
+    worker. When a user was changed both locally and remotely since
+    the last sync the later change wins: a local change is timed when
+    it was made, a remote change by the date stored in its row and a
+    remote delete when it is first seen
+    """
+    def __init__(self, open_remote, replica_path=REPLICA_PATH,
+                 interval=SYNC_INTERVAL):
+        self.open_remote = open_remote
+        self.remote = None
+        self.interval = interval
+        self.replica = storage.SQLiteStorage(replica_path)
+        self.connection = self.replica.connection
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS mutations ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, "
+                "op TEXT, row TEXT, timestamp REAL)")
+            # Row of each user as last agreed with the remote storage
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS synced ("
+                "user_id TEXT PRIMARY KEY, row TEXT)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS sync_state ("
+                "key TEXT PRIMARY KEY, value TEXT)")
+        # Only one thread uses the replica connection at a time
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.questionnaire_synced = False
+        # Reads wait for a first sync only if the replica has never
+        # been filled
+        self.ready = threading.Event()
+        if self.state("last_sync") is not None:
+            self.ready.set()
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+        atexit.register(self.close)
+
+    def state(self, key):
+        """
+        Return a value recorded in the sync state or None
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value FROM sync_state WHERE key = ?",
+                (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def read(self, method, *args):
+        """
+        Call a read method of the replica once it holds data
+        """
+        self.ready.wait()
+        with self.lock:
+            return getattr(self.replica, method)(*args)
+
+    def questionnaire_rows(self):
+        return self.read("questionnaire_rows")
+
+    def find_user(self, user_id):
+        return self.read("find_user", user_id)
+
+    def count_users(self):
+        return self.read("count_users")
+
+    def all_users(self):
+        return self.read("all_users")
+
+    def users_chunk(self, offset, limit):
+        return self.read("users_chunk", offset, limit)
+
+    def set_questionnaire_rows(self, rows):
+        self.ready.wait()
+        self.connect().set_questionnaire_rows(rows)
+        with self.lock:
+            self.replica.set_questionnaire_rows(rows)
+
+    def record(self, user_id, operation, row=None):
+        """
+        Apply a write to the replica and log it in one transaction
+        """
+        with self.lock, self.connection:
+            if row is None:
+                self.connection.execute(
+                    "DELETE FROM co2_scores WHERE user_id = ?", (user_id,))
+            else:
+                self.connection.execute(
+                    "REPLACE INTO co2_scores VALUES "
+                    f"({self.replica.placeholders})", row_strings(row))
+            self.connection.execute(
+                "INSERT INTO mutations (user_id, op, row, timestamp) "
+                "VALUES (?, ?, ?, ?)",
+                (user_id, operation,
+                 None if row is None else json.dumps(list(row)),
+                 time.time()))
+
+    def add_user(self, row):
+        self.record(row[0], "save", row)
+
+    def update_user(self, row):
+        self.record(row[0], "save", row)
+
+    def save_users(self, rows):
+        for row in rows:
+            self.record(row[0], "save", row)
+
+    def delete_user(self, user_id):
+        self.record(user_id, "delete")
+
+    def connect(self):
+        """
+        Return the remote storage, opening it if it is not yet open
+        """
+        if self.remote is None:
+            self.remote = self.open_remote()
+        return self.remote
+
+    def pending_mutations(self):
+        """
+        Return the last logged mutation of each user and the sequence
+        number of the last mutation read
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT seq, user_id, op, row, timestamp FROM mutations "
+                "ORDER BY seq").fetchall()
+            synced = dict(self.connection.execute(
+                "SELECT user_id, row FROM synced"))
+        latest = {}
+        for seq, user_id, operation, row, timestamp in rows:
+            latest[user_id] = {
+                "op": operation,
+                "row": None if row is None else json.loads(row),
+                "timestamp": timestamp,
+                "synced": (json.loads(synced[user_id])
+                           if user_id in synced else None)
+            }
+        return latest, rows[-1][0] if rows else 0
+
+    def settle(self, user_ids, last_seq, rows):
+        """
+        Drop the mutations of users up to last_seq and record the rows
+        agreed with the remote storage for them, applying the rows to
+        the replica. Rows are None for users not stored remotely. Users
+        changed locally after last_seq are left as they are, keeping
+        the last agreed row their changes are checked against
+        """
+        with self.lock, self.connection:
+            for user_id in user_ids:
+                row = rows.get(user_id)
+                self.connection.execute(
+                    "DELETE FROM mutations WHERE user_id = ? AND seq <= ?",
+                    (user_id, last_seq))
+                if self.connection.execute(
+                        "SELECT 1 FROM mutations WHERE user_id = ?",
+                        (user_id,)).fetchone() is not None:
+                    continue
+                if row is None:
+                    self.connection.execute(
+                        "DELETE FROM synced WHERE user_id = ?", (user_id,))
+                    self.connection.execute(
+                        "DELETE FROM co2_scores WHERE user_id = ?",
+                        (user_id,))
+                else:
+                    self.connection.execute(
+                        "REPLACE INTO synced VALUES (?, ?)",
+                        (user_id, json.dumps(row)))
+                    self.connection.execute(
+                        "REPLACE INTO co2_scores VALUES "
+                        f"({self.replica.placeholders})", row)
+
+    def sync(self):
+        """
+        Push the logged mutations to the remote storage in batches,
+        resolving conflicts by time, then pull remote changes into
+        the replica, raising the error of any request that fails
+        """
+        with self.sync_lock:
+            remote = self.connect()
+            if not self.questionnaire_synced:
+                rows = remote.questionnaire_rows()
+                with self.lock:
+                    self.replica.set_questionnaire_rows(rows)
+                self.questionnaire_synced = True
+            remote_rows = {row[0]: row_strings(row)
+                           for row in remote.all_users()}
+            latest, last_seq = self.pending_mutations()
+
+            saves = {}
+            deletes = []
+            remote_wins = {}
+            now = time.time()
+            for user_id, mutation in latest.items():
+                remote_row = remote_rows.get(user_id)
+                if remote_row != mutation["synced"]:
+                    # Changed remotely since the last sync
+                    remote_time = (now if remote_row is None
+                                   else row_time(remote_row))
+                    if remote_time > mutation["timestamp"]:
+                        remote_wins[user_id] = remote_row
+                        continue
+                if mutation["op"] == "save":
+                    saves[user_id] = mutation["row"]
+                elif remote_row is not None:
+                    deletes.append(user_id)
+                else:
+                    remote_wins[user_id] = None
+            if remote_wins:
+                self.settle(remote_wins, last_seq, remote_wins)
+            if saves:
+                remote.save_users(list(saves.values()))
+                pushed = {user_id: row_strings(row)
+                          for user_id, row in saves.items()}
+                remote_rows.update(pushed)
+                self.settle(pushed, last_seq, pushed)
+            for user_id in deletes:
+                remote.delete_user(user_id)
+                del remote_rows[user_id]
+                self.settle([user_id], last_seq, {})
+
+            # Pull the users changed remotely and not locally
+            with self.lock:
+                local_ids = {row[0] for row in self.connection.execute(
+                    "SELECT user_id FROM co2_scores")}
+            self.settle(set(remote_rows) | local_ids, 0, remote_rows)
+            with self.lock, self.connection:
+                self.connection.execute(
+                    "REPLACE INTO sync_state VALUES ('last_sync', ?)",
+                    (str(time.time()),))
+            self.ready.set()
+
+    def flush(self):
+        """
+        Sync with the remote storage now
+        """
+        self.sync()
+
+    def run(self):
+        """
+        Sync at once and then every interval, backing off exponentially
+        while the remote storage cannot be reached. A failed open is
+        retried on the next sync
+        """
+        write_behind.run_with_backoff(self.sync, self.interval,
+                                      delay_first=False)
+
+    def close(self):
+        """
+        Make a last attempt to sync at exit, leaving anything that
+        fails in the mutation log for the next run
+        """
+        try:
+            self.sync()
+        except Exception:  # pylint: disable=broad-except
+            pass
@@ -1,77 +1,267 @@
 """
-Module to import questionnaire from external spreasheet
+Module to import questionnaire from storage and compile it into
+a snapshot file that is loaded without network access or parsing
 """
 
+# Imported library dependencies from the standard library
+import hashlib
+import json
+import math
+from array import array
+from functools import lru_cache
+
+# Custom imports developed for the application
+import files
+import instrument
+import storage
+
+# Bump when the snapshot layout changes so old snapshots are rebuilt
+SNAPSHOT_VERSION = 2
+
+# Characters per line of wrapped text, one in from the terminal edge
+WRAP_WIDTH = 70
+
+# Starts a new line one character in from the edge of the terminal
+LINE_BREAK = "\n\033[1C"
+
+# Compiled questionnaire used at runtime when present
+SNAPSHOT_PATH = "questionnaire_snapshot.json"
+
+# Cells in a bar chart and the largest score drawn without scaling down
+BAR_CELLS = 55
+
+
+@lru_cache(maxsize=64)
+def bar_scale(max_score, cells=BAR_CELLS):
+    """
+    Return the divisor applied to scores and the cells per scaled point
+    for a bar chart of scores out of max_score across the cells
+    """
+    divisor = 4 if max_score > BAR_CELLS else 1
+    return divisor, cells / int(max_score / divisor)
+
+
+def bar_proportion(score, scale):
+    """
+    Return the number of filled bar chart cells for a score
+    """
+    divisor, cells_per_point = scale
+    return math.ceil(cells_per_point * (score / divisor))
+
 
 class Question:
     """
-    Creates a question instance
+    Creates a question instance holding the option text and integer
+    scores in parallel arrays, with the bar chart scale worked out once
     """
+    __slots__ = ("question_info", "max_poss_score", "option_details",
+                 "scores", "bar_scale")
+
     def __init__(self, question_info, max_poss_score, options):
         self.question_info = question_info
         self.max_poss_score = max_poss_score
-        self.options = options
+        self.option_details = tuple(option["option_detail"]
+                                    for option in options)
+        self.scores = array("l", (option["score"] for option in options))
+        self.bar_scale = bar_scale(max_poss_score)
 
 
-def string_wrap(string):
+@instrument.timed("questionnaire.string_wrap")
+@lru_cache(maxsize=1024)
+def string_wrap(string, width=WRAP_WIDTH):
     """
-    Take strings and add a newline escape sequence
-    after every 55th character where necessary to wrap
-    the strings within a terminal
+    Take strings and add a newline escape sequence after the last space
+    that keeps each line within the width, breaking words only where
+    a line has no space. Each character is visited a bounded number of
+    times and results are cached per string and width
     """
-    new_string = ""
-    string.replace("\n", "")
-    if len(string) <= 70:
+    string = string.replace("\n", "")
+    if len(string) <= width:
         return string
-    else:
-        list_string = list(string)
-        ind = 70
-        while len(list_string) > ind:
-            while list_string[ind] != " ":
-                ind -= 1
-            list_string.insert(ind + 1, "\n\033[1C")
-            ind += 69
-        new_string = "".join(list_string)
-        return new_string
+    lines = []
+    start = 0
+    while len(string) - start > width:
+        end = string.rfind(" ", start, start + width + 1)
+        if end == -1:
+            end = start + width
+            lines.append(string[start:end])
+        else:
+            # Keep the space at the end of the line
+            end += 1
+            lines.append(string[start:end])
+        start = end
+    lines.append(string[start:])
+    return LINE_BREAK.join(lines)
+
+
+def parse_score(score):
+    """
+    Convert a score cell such as "Max possible score 15" to an integer
+    """
+    return int(score.replace("Max possible score ", ""))
+
+
+def rows_hash(questionnaire_raw):
+    """
+    Return a hash of the questionnaire worksheet content
+    """
+    content = json.dumps(questionnaire_raw, separators=(",", ":"))
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
 
 
 # The questionnaire is sourced from www.wikihow.com
 # https://www.wikihow.com/Calculate-Your-Carbon-Footprint
-def get_questionnaire(co2_sheet):
+def compile_questionnaire(questionnaire_raw, width=WRAP_WIDTH):
     """
-    Import the questionnaire from the external spreadsheet
+    Compile the questionnaire worksheet rows into plain data holding
+    text wrapped to the width, the unwrapped text for other widths,
+    integer scores and the maximum possible total
     """
-    first_step = True
-    questionnaire_raw = co2_sheet.worksheet("questionnaire").get_all_values()
-    question_info = ""
-    max_poss_score = None
-    # Options held in a list so order retained
-    options = []
-    # Questions held in a list so order retained
-    questions = []
-    questionnaire = {}
+    compiled = {
+        "version": SNAPSHOT_VERSION,
+        "source_hash": rows_hash(questionnaire_raw),
+        "width": width,
+        "questions": []
+    }
+    question = None
     for row in questionnaire_raw:
         if "Instructions" in row[0]:
-            questionnaire["Instructions"] = string_wrap(row[1])
+            compiled["Instructions"] = string_wrap(row[1], width)
+            compiled["instructions_text"] = row[1]
         elif "Question" in row[0]:
-            if first_step is True:
-                first_step = False
-            else:
-                question_instance = Question(question_info, max_poss_score,
-                                             options)
-                questions.append(question_instance)
-            options = []
-            question_info = string_wrap(row[1])
-            max_poss_score = row[2]
+            question = {
+                "question_info": string_wrap(row[1], width),
+                "question_text": row[1],
+                "max_poss_score": parse_score(row[2]),
+                # Options held in a list so order retained
+                "options": []
+            }
+            # Questions held in a list so order retained
+            compiled["questions"].append(question)
         elif "Option" in row[0]:
-            option = {}
-            option["option_detail"] = string_wrap(row[1])
-            option["score"] = row[2]
-            options.append(option)
+            question["options"].append({
+                "option_detail": string_wrap(row[1], width),
+                "option_text": row[1],
+                "score": int(row[2])
+            })
         elif "Summary" in row[0]:
-            questionnaire["summary"] = string_wrap(row[1])
-            question_instance = Question(question_info, max_poss_score,
-                                         options)
-            questions.append(question_instance)
-            questionnaire["questions"] = questions
+            compiled["summary"] = string_wrap(row[1], width)
+            compiled["summary_text"] = row[1]
+    compiled["max_total"] = sum(question["max_poss_score"]
+                                for question in compiled["questions"])
+    return compiled
+
+
+def build_questionnaire(compiled, width=None):
+    """
+    Create the questionnaire used by the application from compiled
+    questionnaire data, rewrapping the text if a different
+    width is requested
+    """
+    rewrap = width is not None and width != compiled["width"]
+
+    def layout(wrapped, text):
+        return string_wrap(text, width) if rewrap else wrapped
+
+    questions = []
+    for question in compiled["questions"]:
+        options = [{"option_detail": layout(option["option_detail"],
+                                            option["option_text"]),
+                    "score": option["score"]}
+                   for option in question["options"]]
+        questions.append(Question(layout(question["question_info"],
+                                         question["question_text"]),
+                                  question["max_poss_score"], options))
+    questionnaire = {
+        "Instructions": layout(compiled["Instructions"],
+                               compiled["instructions_text"]),
+        "summary": layout(compiled["summary"], compiled["summary_text"]),
+        "max_total": compiled["max_total"],
+        "max_scores": array("l", (question.max_poss_score
+                                  for question in questions)),
+        "total_bar_scale": bar_scale(compiled["max_total"]),
+        "questions": questions
+    }
     return questionnaire
+
+
+def load_snapshot(snapshot_path=SNAPSHOT_PATH):
+    """
+    Return the compiled questionnaire held in the snapshot file or None
+    if there is no usable snapshot
+    """
+    try:
+        with open(snapshot_path, encoding="utf-8") as snapshot:
+            compiled = json.load(snapshot)
+    except (OSError, ValueError):
+        return None
+    if compiled.get("version") != SNAPSHOT_VERSION:
+        return None
+    return compiled
+
+
+def write_snapshot(compiled, snapshot_path=SNAPSHOT_PATH):
+    """
+    Write the compiled questionnaire to the snapshot file, returning
+    whether it was written
+    """
+    return files.atomic_write(
+        snapshot_path,
+        lambda snapshot: json.dump(compiled, snapshot, separators=(",", ":")),
+        required=False)
+
+
+def compile_snapshot(co2_storage, snapshot_path=SNAPSHOT_PATH):
+    """
+    Fetch the questionnaire from storage and rebuild the snapshot file
+    if the questionnaire has changed, returning the compiled
+    questionnaire and whether the snapshot was rebuilt
+    """
+    questionnaire_raw = co2_storage.questionnaire_rows()
+    compiled = load_snapshot(snapshot_path)
+    if (compiled is not None
+            and compiled["source_hash"] == rows_hash(questionnaire_raw)):
+        return compiled, False
+    compiled = compile_questionnaire(questionnaire_raw)
+    return compiled, write_snapshot(compiled, snapshot_path)
+
+
+@instrument.timed("questionnaire.load_compiled")
+def load_compiled(co2_storage, snapshot_path=SNAPSHOT_PATH):
+    """
+    Load the compiled questionnaire from the snapshot file, compiling
+    it from storage when there is no snapshot yet. A snapshot is
+    checked against storage in the background and rebuilt if the
+    questionnaire has changed, so the change is loaded from the next
+    start
+    """
+    compiled = load_snapshot(snapshot_path)
+    if compiled is None:
+        compiled = compile_snapshot(co2_storage, snapshot_path)[0]
+    else:
+        storage.run_in_background(compile_snapshot, co2_storage,
+                                  snapshot_path)
+    return compiled
+
+
+@instrument.timed("questionnaire.get_questionnaire")
+def get_questionnaire(co2_storage, snapshot_path=SNAPSHOT_PATH, width=None):
+    """
+    Load the questionnaire from the snapshot file, compiling it from
+    storage when there is no snapshot yet, with text wrapped to the
+    width or the width of the snapshot
+    """
+    return build_questionnaire(load_compiled(co2_storage, snapshot_path),
+                               width)
+
+
+def main():
+    """
+    Compile the questionnaire snapshot from the configured storage
+    """
+    rebuilt = compile_snapshot(storage.open_storage())[1]
+    print("Questionnaire snapshot " + ("rebuilt" if rebuilt else "unchanged"))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,36 +5,64 @@ carbon footprint
 
 # Imported library dependencies from third party sources
 import time
-import sys
-import string
-import random
+import os
+import atexit
 import copy
-import math
 from datetime import datetime
-import gspread
-from google.oauth2.service_account import Credentials
+from functools import lru_cache
 from colorama import Fore, Back, Style
 
 # Custom imports developed for the application
+import analytics
 import gui
+import history
+import instrument
+import offline
 import questionnaire
-
-# SCOPE definition code provided by Code Institute
-SCOPE = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive.file",
-    "https://www.googleapis.com/auth/drive"
-    ]
-
-# Code to access Google Sheets provided by code institute
-# Code Institute code begins here
-CREDS = Credentials.from_service_account_file('creds.json')
-SCOPED_CREDS = CREDS.with_scopes(SCOPE)
-GSPREAD_CLIENT = gspread.authorize(SCOPED_CREDS)
-CO2_SHEET = GSPREAD_CLIENT.open('co2_score')
-# Code Institute code ends here
-
-questionnaire_details = questionnaire.get_questionnaire(CO2_SHEET)
+import storage
+import user_ids
+import write_behind
+
+# Start time for the startup timing report
+START_TIME = time.perf_counter()
+
+# Storage holding the questionnaire and users' scores, chosen with the
+# CO2_STORAGE environment variable. The connection and questionnaire
+# download run in the background while the splash screens are shown
+# and results are written from a background queue. Storage calls are
+# timed when instrumentation is turned on. The questionnaire is laid
+# out for each screen width when first shown at that width. Setting
+# CO2_OFFLINE to the path of a local replica runs sessions against
+# the replica, synced with storage whenever it can be reached
+if os.environ.get("CO2_OFFLINE"):
+    STORAGE = instrument.instrument_storage(offline.OfflineStorage(
+        lambda: instrument.instrument_storage(storage.open_storage(),
+                                              "backend"),
+        os.environ["CO2_OFFLINE"]), "storage")
+else:
+    STORAGE = instrument.instrument_storage(
+        write_behind.WriteBehindStorage(instrument.instrument_storage(
+            storage.DeferredStorage(), "backend")), "storage")
+QUESTIONNAIRE = storage.run_in_background(questionnaire.load_compiled,
+                                          STORAGE)
+# Statistics of every stored score, read once and kept up to date
+# as results are stored and deleted
+COHORT = storage.run_in_background(analytics.load_cohort, STORAGE)
+# Every result stored by each user, kept locally for score trends
+HISTORY = history.HistoryStore()
+
+# Sessions shown in the score history and the width of their bars
+TREND_SESSIONS = 5
+TREND_WIDTH = 40
+
+# Seconds from process start to each startup milestone
+startup_times = {}
+QUESTIONNAIRE.add_done_callback(
+    lambda future: startup_times.setdefault(
+        "questionnaire ready", time.perf_counter() - START_TIME))
+
+# Screens draw into the screen buffer which only sends changed cells
+screen = gui.screen
 
 
 class User():
@@ -65,6 +93,8 @@ class PreviousUser(User):
     def __init__(self, user_id):
         super().__init__(user_id)
         self.previous_user = True
+        # Stored profile the session results are compared with
+        self.profile = None
         self.previous_results = {
             "date": None,
             "results": None,
@@ -72,50 +102,97 @@ class PreviousUser(User):
         }
 
 
+def questionnaire_details():
+    """
+    Return the questionnaire laid out for the width of the screen,
+    waiting for it to finish loading
+    """
+    return questionnaire_layout(gui.layout_width(questionnaire.WRAP_WIDTH))
+
+
+@lru_cache(maxsize=8)
+def questionnaire_layout(width):
+    """
+    Return the questionnaire with text wrapped to the width
+    """
+    return questionnaire.build_questionnaire(QUESTIONNAIRE.result(), width)
+
+
+def cohort_stats():
+    """
+    Return the stored score statistics, waiting for them to finish loading
+    """
+    return COHORT.result()
+
+
+def cohort_row(results):
+    """
+    Return the results and final score of a user as a statistics row
+    """
+    return list(results["results"]) + [int(results["final_score"])]
+
+
+def startup_report():
+    """
+    Append the startup times to the file named by the
+    CO2_STARTUP_REPORT environment variable
+    """
+    report_path = os.environ.get("CO2_STARTUP_REPORT")
+    if not report_path:
+        return
+    milestones = ", ".join(
+        f"{name} {seconds:.3f}s" for name, seconds
+        in sorted(startup_times.items(), key=lambda item: item[1]))
+    with open(report_path, "a", encoding="utf-8") as report:
+        report.write(f"startup: {milestones}\n")
+
+
 def main_menu(current_user):
     """
-    Display the main menu to the user and action there
-    option choice
+    Display the main menu to the user and return the state
+    for there option choice
     """
     valid_input = False
     while valid_input is False:
         gui.terminal_control("clear_screen")
         if current_user is not None and current_user.user_id is not None:
-            print(f"\033[1CUser logged in: {current_user.user_id}\n")
-        print("                                    CO2 SCORE")
-        print("                            Calculate your co2 score\n")
+            screen.print(f"\033[1CUser logged in: {current_user.user_id}\n")
+        screen.print("                                    CO2 SCORE")
+        screen.print("                            Calculate your co2 score\n")
         # Moves cursor 1 place to right with \033[1C
-        print("\n\033[1CMain menu\n")
-        print("\033[1C1. View instructions\n")
-        print("\033[1C2. Start the questionnaire\n")
-        print("\033[1C3. Administer data\n")
-        print("\033[1C4. Exit software\n")
+        screen.print("\n\033[1CMain menu\n")
+        screen.print("\033[1C1. View instructions\n")
+        screen.print("\033[1C2. Start the questionnaire\n")
+        screen.print("\033[1C3. Administer data\n")
+        screen.print("\033[1C4. Exit software\n")
         if current_user is not None and current_user.user_id is not None:
-            print("\033[1C5. Log out\n")
+            screen.print("\033[1C5. Log out\n")
             menu_range = 5
         else:
             menu_range = 4
-        response = input(f"\033[1CPlease select an option [1-{menu_range}]: ")
+        response = screen.input("\033[1CPlease select an option "
+                                f"[1-{menu_range}]: ")
         valid_input = validate_option_input(response, menu_range)
     if response == "1":
-        instructions(current_user)
+        return (instructions, current_user)
     elif response == "2":
         if current_user is None:
-            current_user = load_user(current_user, "questions")
-        question_user(current_user)
+            return (load_user, current_user, "questions")
+        return (question_user, current_user)
     elif response == "3":
-        administer_data(current_user)
+        return (administer_data, current_user)
     elif response == "4":
-        print(Style.RESET_ALL)
+        screen.print(Style.RESET_ALL)
         gui.set_gui_background("assets/images/gui_world.bmp")
-        print("\033[23;37H\033[44;37mEXITING")
+        screen.print("\033[23;37H\033[44;37mEXITING")
+        screen.flush()
         time.sleep(2)
-        print(Style.RESET_ALL)
+        screen.print(Style.RESET_ALL)
         gui.terminal_control("clear_screen")
         gui.terminal_control("cursor_home")
-        sys.exit()
-    elif response == "5":
-        log_out(current_user)
+        screen.flush()
+        return None
+    return (log_out, current_user)
 
 
 def validate_option_input(user_input, user_range):
@@ -131,9 +208,9 @@ def validate_option_input(user_input, user_range):
             )
     except ValueError as error:
         gui.terminal_control("clear_screen")
-        print(f"\033[1CData invalid: {error}")
-        print(f"\033[1CPlease select an option from 1 - {user_range}")
-        input("\033[23;2HPress Enter to try again")
+        screen.print(f"\033[1CData invalid: {error}")
+        screen.print(f"\033[1CPlease select an option from 1 - {user_range}")
+        screen.input("\033[23;2HPress Enter to try again")
         return False
 
     return True
@@ -147,19 +224,18 @@ def instructions(current_user):
     valid_response = False
     while valid_response is False:
         gui.terminal_control("clear_screen")
-        print("\033[1CInstructions\n")
-        print(f'\033[1C{questionnaire_details["Instructions"]}')
-        print("\n")
-        print("\033[1C1. Continue to questionnaire")
-        print("\033[1C2. Return to main menu")
-        user_choice = input("\033[1CPlease enter an option [1 or 2]: ")
+        screen.print("\033[1CInstructions\n")
+        screen.print(f'\033[1C{questionnaire_details()["Instructions"]}')
+        screen.print("\n")
+        screen.print("\033[1C1. Continue to questionnaire")
+        screen.print("\033[1C2. Return to main menu")
+        user_choice = screen.input("\033[1CPlease enter an option [1 or 2]: ")
         valid_response = validate_option_input(user_choice, 2)
     if user_choice == "1":
         if current_user is None:
-            current_user = load_user(current_user, "questions")
-        question_user(current_user)
-    elif user_choice == "2":
-        return main_menu(current_user)
+            return (load_user, current_user, "questions")
+        return (question_user, current_user)
+    return (main_menu, current_user)
 
 
 def administer_data(current_user):
@@ -167,33 +243,33 @@ def administer_data(current_user):
     Enable users with a user id to administer their data
     """
     if current_user is None:
-        current_user = load_user(current_user, "main_menu")
+        return (load_user, current_user, "main_menu")
     valid_response = False
     while valid_response is False:
         gui.terminal_control("clear_screen")
-        print(f"\033[1CUser logged in: {current_user.user_id}\n")
-        print("\033[1C1. Review previous score")
-        print("\033[1C2. Delete data")
-        print("\033[1C3. Return to main menu")
-        response = input("\033[1CPlease select an option [1-3]: ")
+        screen.print(f"\033[1CUser logged in: {current_user.user_id}\n")
+        screen.print("\033[1C1. Review previous score")
+        screen.print("\033[1C2. Delete data")
+        screen.print("\033[1C3. Return to main menu")
+        response = screen.input("\033[1CPlease select an option [1-3]: ")
         valid_response = validate_option_input(response, 3)
     if response == "1":
         previous_score = current_user.previous_results["final_score"]
         gui.terminal_control("clear_screen")
+        score_trend(current_user, int(180))
         bar_chart(current_user, int(previous_score), int(180), "previous")
-        print("\033[14;2H" + questionnaire_details["summary"] + "\n")
-        input("\033[1CPress enter to continue.....")
-        administer_data(current_user)
+        screen.print("\033[14;2H" + questionnaire_details()["summary"] + "\n")
+        screen.input("\033[1CPress enter to continue.....")
+        return (administer_data, current_user)
     elif response == "2":
-        co2_scores_sheet = CO2_SHEET.worksheet("co2_scores")
-        cell = co2_scores_sheet.find(current_user.user_id)
-        co2_scores_sheet.delete_rows(cell.row)
+        cohort_stats().remove(cohort_row(current_user.previous_results))
+        HISTORY.delete(current_user.user_id)
+        STORAGE.delete_user(current_user.user_id)
         gui.terminal_control("clear_screen")
-        print("\033[1CYour data has been deleted")
-        input("\033[23;2HPress enter to continue....")
-        log_out(current_user)
-    elif response == "3":
-        main_menu(current_user)
+        screen.print("\033[1CYour data has been deleted")
+        screen.input("\033[23;2HPress enter to continue....")
+        return (log_out, current_user)
+    return (main_menu, current_user)
 
 
 def log_out(current_user):
@@ -203,9 +279,9 @@ def log_out(current_user):
     """
     del current_user
     gui.terminal_control("clear_screen")
-    print("\033[2;2HYou have been logged out")
-    input("\033[23;2HPress enter to continue.....")
-    main_menu(None)
+    screen.print("\033[2;2HYou have been logged out")
+    screen.input("\033[23;2HPress enter to continue.....")
+    return (main_menu, None)
 
 
 def initialise_user():
@@ -217,9 +293,10 @@ def initialise_user():
     return current_user
 
 
-def validate_user_id_entry(user_id, current_user, cell, option):
+def validate_user_id_entry(user_id, current_user, profile, option):
     """
-    Validate user id entry
+    Validate user id entry, returning True if valid or else the
+    state the user chose next, None to enter the id again
     """
     try:
         if user_id.isalnum() is False:
@@ -230,60 +307,55 @@ def validate_user_id_entry(user_id, current_user, cell, option):
             raise ValueError("\033[1CThe entered "
                              "value must be 5 alphanumeric characters\n"
                              f"\033[1CYou entered {len(user_id)} characters.")
-        elif cell is None:
+        elif profile is None:
             raise ValueError("\033[1CThe user id cannot be found.")
     except ValueError as error:
         gui.terminal_control("clear_screen")
-        print(f"\033[1CUser data invalid: {error}")
+        screen.print(f"\033[1CUser data invalid: {error}")
         if option == "main_menu":
-            user_input = input('\033[23;2HPress Enter to continue.....')
-            main_menu(current_user)
-        elif option == "questions":
-            user_input = input('\033[23;2HPress Enter to try again '
-                               'or "q" to start the quesionnaire: ')
-            if user_input.lower() == "q":
-                question_user(current_user)
-        return False
+            screen.input('\033[23;2HPress Enter to continue.....')
+            return (main_menu, current_user)
+        user_input = screen.input('\033[23;2HPress Enter to try again '
+                                  'or "q" to start the quesionnaire: ')
+        if user_input.lower() == "q":
+            return (question_user, initialise_user())
+        return None
 
     return True
 
 
 def load_user(current_user, option):
     """
-    Request entry of user id
+    Request entry of user id and continue to the questions or the
+    administer data menu, depending on the option, with the user
     """
-    if current_user is None:
-        valid_user_id = False
-        while valid_user_id is False:
-            gui.terminal_control("clear_screen")
-            print("\033[1CIf you have a user id to retrieve previous data,")
-            user_id = input("\033[1Center it now or press enter to continue: ")
-            if user_id == "":
-                if option == "questions":
-                    valid_user_id = True
-                    current_user = initialise_user()
-                    return current_user
-                elif option == "main_menu":
-                    return main_menu(current_user)
-            else:
-                co2_scores_sheet = CO2_SHEET.worksheet("co2_scores")
-                cell = co2_scores_sheet.find(user_id)
-                valid_user_id = validate_user_id_entry(user_id,
-                                                       current_user,
-                                                       cell, option)
-        previous_results_row = co2_scores_sheet.row_values(cell.row)
-        print(f"valid_user_id = {user_id}")
-        current_user = PreviousUser(user_id)
-        current_user.previous_results["date"] = previous_results_row[1]
-        previous_results = []
-        for result in range(2, 14):
-            print(previous_results_row[result])
-            previous_results.append(int(previous_results_row[result]))
-        current_user.previous_results["results"] = previous_results
-        final_score = previous_results_row[14]
-        current_user.previous_results["final_score"] = final_score
-        current_user.date()
-    return current_user
+    valid_user_id = None
+    while valid_user_id is not True:
+        gui.terminal_control("clear_screen")
+        screen.print("\033[1CIf you have a user id to retrieve "
+                     "previous data,")
+        user_id = screen.input("\033[1Center it now or press enter "
+                               "to continue: ")
+        if user_id == "":
+            if option == "questions":
+                return (question_user, initialise_user())
+            return (main_menu, current_user)
+        # Only ids in the allocated format are looked up
+        profile = (STORAGE.user_profile(user_id)
+                   if storage.valid_user_id(user_id) else None)
+        valid_user_id = validate_user_id_entry(user_id, current_user,
+                                               profile, option)
+        if valid_user_id not in (True, None):
+            return valid_user_id
+    current_user = PreviousUser(user_id)
+    current_user.profile = profile
+    current_user.previous_results["date"] = profile.date
+    current_user.previous_results["results"] = profile.results
+    current_user.previous_results["final_score"] = profile.final_score
+    current_user.date()
+    if option == "questions":
+        return (question_user, current_user)
+    return (administer_data, current_user)
 
 
 def store_results(current_user):
@@ -297,22 +369,34 @@ def store_results(current_user):
     for data in current_user.session_results["results"]:
         sheet_data.append(data)
     sheet_data.append(str(current_user.session_results["final_score"]))
-    user_sheet = CO2_SHEET.worksheet("co2_scores")
+    # Statistics are updated before the write so that statistics still
+    # loading from storage cannot count the new row twice
+    if current_user.previous_user is True:
+        cohort_stats().remove(cohort_row(current_user.previous_results))
+    cohort_stats().add(cohort_row(current_user.session_results))
+    # Users who stored results before the history was kept start
+    # their history with the result they had stored
+    if (current_user.previous_user is True
+            and len(HISTORY.history(current_user.user_id)) == 0):
+        HISTORY.append(current_user.user_id,
+                       current_user.previous_results["date"],
+                       current_user.previous_results["results"],
+                       int(current_user.previous_results["final_score"]))
+    HISTORY.append(current_user.user_id, date,
+                   current_user.session_results["results"],
+                   current_user.session_results["final_score"])
     if current_user.previous_user is False:
-        user_sheet.append_row(sheet_data)
+        STORAGE.add_user(sheet_data)
     elif current_user.previous_user is True:
-        cell = user_sheet.find(current_user.user_id)
-        sheet_range = "A" + str(cell.row) + ":O" + str(cell.row)
-        update_data = []
-        update_data.append(sheet_data)
-        user_sheet.update(sheet_range, update_data)
+        STORAGE.update_user(sheet_data)
     # Make previous results current results only if user wasn't a previous user
     # before this session
     previous_results = copy.deepcopy(current_user.session_results)
     current_user.previous_results = previous_results
+    current_user.profile = storage.UserProfile(sheet_data)
     # Make previous user True in case saved for first time
     current_user.previous_user = True
-    main_menu(current_user)
+    return (main_menu, current_user)
 
 
 def results(current_user, max_total):
@@ -322,14 +406,29 @@ def results(current_user, max_total):
     user_results = sum(current_user.session_results["results"])
     current_user.session_results["final_score"] = user_results
     gui.terminal_control("clear_screen")
-    print(f"\033[1CYour total carbon footprint score is {user_results}")
-    print("\033[14;2H" + questionnaire_details["summary"] + "\n\n")
-    bar_chart(current_user, user_results, max_total, "current")
+    screen.print(f"\033[1CYour total carbon footprint score is {user_results}")
+    # A returning user is not ranked against their own stored score
+    percentile = cohort_stats().percentile_rank(
+        user_results,
+        exclude=(current_user.previous_results["final_score"]
+                 if current_user.previous_user is True else None))
+    if percentile is not None:
+        screen.print(f"\033[4;2HYou are in the {analytics.ordinal(percentile)}"
+                     " percentile of stored scores")
+    screen.print("\033[14;2H" + questionnaire_details()["summary"] + "\n\n")
+    total_bar_scale = questionnaire_details()["total_bar_scale"]
+    bar_chart(current_user, user_results, max_total, "current",
+              total_bar_scale)
     if current_user.previous_user is True:
         previous_score = int(current_user.previous_results["final_score"])
-        bar_chart(current_user, previous_score, max_total, "previous")
-        input("\033[23;2HPress enter to continue.....")
-    store_data(current_user)
+        bar_chart(current_user, previous_score, max_total, "previous",
+                  total_bar_scale)
+        deltas = current_user.profile.deltas(
+            current_user.session_results["results"])
+        screen.print("\033[12;2HChange per question: "
+                     + " ".join(f"{delta:+d}" for delta in deltas))
+        screen.input("\033[23;2HPress enter to continue.....")
+    return (store_data, current_user)
 
 
 def question_user(current_user):
@@ -339,111 +438,114 @@ def question_user(current_user):
     responses into a variable
     """
     responses = []
-    max_total = 0
     index = 0
-    num_of_questions = len(questionnaire_details["questions"])
+    num_of_questions = len(questionnaire_details()["questions"])
     question_num = 1
-    for question in questionnaire_details["questions"]:
+    for question in questionnaire_details()["questions"]:
         valid_input = False
         while valid_input is False:
             gui.terminal_control("clear_screen")
-            print(f"\033[1CQuestion {question_num} of {num_of_questions}\n")
-            print(f"\033[1C{question.question_info}\n")
-            ind = 1
-            option_list = []
-            for option in question.options:
-                option_list.append(option["option_detail"])
-                print(f"\033[1C{ind}. " + option["option_detail"])
-                ind += 1
-            num = len(question.options)
-            response = input(f"\n\033[1CPlease select an option [1-{num}]: ")
+            screen.print(f"\033[1CQuestion {question_num} "
+                         f"of {num_of_questions}\n")
+            screen.print(f"\033[1C{question.question_info}\n")
+            for ind, option_detail in enumerate(question.option_details,
+                                                start=1):
+                screen.print(f"\033[1C{ind}. " + option_detail)
+            num = len(question.option_details)
+            response = screen.input("\n\033[1CPlease select an option "
+                                    f"[1-{num}]: ")
             valid_input = validate_option_input(response, num)
         question_num += 1
-        option_chosen = option_list[int(response) - 1]
-        score = int(question.options[int(response) - 1]["score"])
+        choice = int(response) - 1
+        option_chosen = question.option_details[choice]
+        score = question.scores[choice]
         max_poss_score = question.max_poss_score
-        max_poss_score = max_poss_score.replace("Max possible score ", "")
-        max_total += int(max_poss_score)
         responses.append(score)
         gui.terminal_control("clear_screen")
-        print(f"\033[2;2HYou chose option:\n\033[1C'{option_chosen}'")
-        print(f"\033[1C{score} points have been added to your carbon score")
-        bar_chart(current_user, score, max_poss_score, "current")
+        screen.print(f"\033[2;2HYou chose option:\n\033[1C'{option_chosen}'")
+        screen.print(f"\033[1C{score} points have been added to your "
+                     "carbon score")
+        bar_chart(current_user, score, max_poss_score, "current",
+                  question.bar_scale)
         if current_user.previous_user is True:
             score = current_user.previous_results["results"][index]
-            bar_chart(current_user, score, max_poss_score, "previous")
-            input("\033[23;2HPress enter to continue.....")
+            bar_chart(current_user, score, max_poss_score, "previous",
+                      question.bar_scale)
+            screen.input("\033[23;2HPress enter to continue.....")
         index += 1
     current_user.session_results["results"] = responses
-    results(current_user, max_total)
+    return (results, current_user, questionnaire_details()["max_total"])
 
 
-def bar_chart(current_user, score, max_score, session):
+@instrument.timed("run.bar_chart")
+def bar_chart(current_user, score, max_score, session, scale=None,
+              width=None):
     """
     Show the users response as a proportion of highest possible
     score in the form of a bar chart and show comparison to any
-    present previous results
+    present previous results. The bar fills the width of the screen
+    unless a width is given and the scale is worked out from the
+    max score unless the questionnaire already holds it
     """
+    if width is None:
+        width = gui.layout_width(gui.BAR_WIDTH)
     # Scale down max_total and score to fit on bar chart when necessary
-    max_score_scaled = max_score / 4 if int(max_score) > 55 else max_score
-    user_results_scaled = score / 4 if int(max_score) > 55 else score
+    if scale is None or width != questionnaire.BAR_CELLS:
+        scale = questionnaire.bar_scale(int(max_score), width)
     if session == "current":
-        bar_chart_string = "\033[7;13H"
-        print(f"\033[6;2HYour score is {score}")
+        row = 7
+        screen.print(f"\033[6;2HYour score is {score}")
     elif session == "previous":
+        row = 10
         previous_date = current_user.previous_results["date"]
-        print(f"\033[9;2HYour previous score on {previous_date} was {score}")
-        bar_chart_string = "\033[10;13H"
-    proportion = math.ceil((55 / int(max_score_scaled)) * user_results_scaled)
-    for i in range(55):
-        if i < proportion:
-            # 60 is the recommended carbon score max
-            if int(score) > 60:
-                bar_chart_string += "\033[41;31m\u2588"
-            else:
-                bar_chart_string += "\033[42;32m\u2588"
-        elif i == proportion:
-            bar_chart_string += "\033[42;30m\u2588"
-        else:
-            bar_chart_string += "\033[47;30m\u2591"
-    if session == "current":
-        print("\033[7;4HMin 0" + bar_chart_string)
-        print(Back.BLUE + Fore.WHITE + Style.BRIGHT)
-        print(f"\033[7;70HMax {max_score}")
-    elif session == "previous":
-        print("\033[10;4HMin 0" + bar_chart_string)
-        print(Back.BLUE + Fore.WHITE + Style.BRIGHT)
-        print(f"\033[10;70HMax {max_score}")
+        screen.print(f"\033[9;2HYour previous score on {previous_date} "
+                     f"was {score}")
+    proportion = questionnaire.bar_proportion(score, scale)
+    # 60 is the recommended carbon score max
+    bar_chart_string = gui.render_bar(proportion, int(score) > 60, row, width)
+    screen.print(f"\033[{row};4HMin 0" + bar_chart_string)
+    screen.print(Back.BLUE + Fore.WHITE + Style.BRIGHT)
+    screen.print(f"\033[{row};{width + 15}HMax {max_score}")
     if current_user.previous_user is False:
-        input("\033[23;2HPress enter to continue.....")
+        screen.input("\033[23;2HPress enter to continue.....")
         gui.terminal_control("clear_screen")
 
 
+@instrument.timed("run.score_trend")
+def score_trend(current_user, max_score):
+    """
+    Show the final scores of the user's most recent sessions as
+    small bar charts, oldest first, when more than one is stored
+    """
+    sessions = HISTORY.history(current_user.user_id)[-TREND_SESSIONS:]
+    if len(sessions) < 2:
+        return
+    screen.print("\033[2;2HYour recent scores")
+    width = gui.layout_width(TREND_WIDTH)
+    scale = questionnaire.bar_scale(max_score, width)
+    for row, (date, total) in enumerate(
+            zip(sessions["date"].tolist(), sessions["total"].tolist()),
+            start=3):
+        screen.print(f"\033[{row};2H{date.decode('ascii')}"
+                     + gui.render_bar(questionnaire.bar_proportion(
+                         total, scale), total > 60, row, width))
+        screen.print(Back.BLUE + Fore.WHITE + Style.BRIGHT)
+        screen.print(f"\033[{row};{width + 15}H{total}")
+
+
 def create_user_id():
     """
-    Generate and return a random 5 character alphanumeric user id
-    """
-    num_char_pool = list(string.ascii_letters)
-    num_pool = range(10)
-    num_char_pool += [str(num) for num in num_pool]
-    new_user_id = False
-    while new_user_id is False:
-        user_id_list = []
-        index = 5
-        while index > 0:
-            index -= 1
-            user_id_list.append(random.choice(num_char_pool))
-        user_id = "".join(user_id_list)
-        co2_scores_sheet = CO2_SHEET.worksheet("co2_scores")
-        cell = co2_scores_sheet.find(user_id)
-        if cell is None:
-            new_user_id = True
+    Allocate and return a unique 5 character alphanumeric user id
+    """
+    user_id = user_ids.UserIdAllocator(STORAGE).allocate()
     gui.terminal_control("clear_screen")
-    print("\033[1CIf you use this tool again the user id can be used to load")
-    print("\033[1Cthis sessions data for comparison. Keep it safe it cannot")
-    print("\033[1Cbe retrieved if lost\n")
-    print(f"\033[1CYour user id is: {user_id}\n")
-    input("\033[23;2HPress Enter to continue when ready .....")
+    screen.print("\033[1CIf you use this tool again the user id can be "
+                 "used to load")
+    screen.print("\033[1Cthis sessions data for comparison. Keep it safe "
+                 "it cannot")
+    screen.print("\033[1Cbe retrieved if lost\n")
+    screen.print(f"\033[1CYour user id is: {user_id}\n")
+    screen.input("\033[23;2HPress Enter to continue when ready .....")
     return user_id
 
 
@@ -460,8 +562,8 @@ def validate_range(user_input, valid_range):
             )
     except ValueError as error:
         gui.terminal_control("clear_screen")
-        print(f"\033[1CData invalid: {error}")
-        input("\033[23;2HPress Enter to try again")
+        screen.print(f"\033[1CData invalid: {error}")
+        screen.input("\033[23;2HPress Enter to try again")
         gui.terminal_control("clear_screen")
         return False
 
@@ -476,19 +578,16 @@ def store_data(current_user):
     if current_user.previous_user is False:
         valid_input = False
         while valid_input is False:
-            print("\033[1CWould you like your results to be stored?")
-            user_input = input('\033[1CPlease enter "y" or "n": ')
+            screen.print("\033[1CWould you like your results to be stored?")
+            user_input = screen.input('\033[1CPlease enter "y" or "n": ')
             user_input.lower()
             valid_input = validate_range(user_input, ["y", "n"])
         if user_input == "n":
             del current_user
-            main_menu(None)
-        else:
-            user_id = create_user_id()
-            current_user.user_id = user_id
-            store_results(current_user)
-    else:
-        store_results(current_user)
+            return (main_menu, None)
+        user_id = create_user_id()
+        current_user.user_id = user_id
+    return (store_results, current_user)
 
 
 def main():
@@ -496,11 +595,28 @@ def main():
     Run all program functions
     """
     gui.set_gui_background("assets/images/gui_world.bmp")
+    screen.flush()
+    startup_times.setdefault("first frame", time.perf_counter() - START_TIME)
     time.sleep(3)
     gui.set_gui_background("assets/images/gui_back_blue_1.bmp")
     gui.app_title()
+    screen.flush()
     time.sleep(3)
-    main_menu(None)
+    run_session((main_menu, None))
+
+
+def run_session(state):
+    """
+    Run screens one after another until the session ends. Each screen
+    returns the next state as a tuple of the screen function and its
+    arguments, or None at the end, so the call stack never grows
+    """
+    while state is not None:
+        screen_function, *args = state
+        state = screen_function(*args)
 
 
-main()
+if __name__ == "__main__":
+    atexit.register(startup_report)
+    screen.resize(*gui.terminal_size())
+    main()
@@ -0,0 +1,246 @@
+"""
+Module to score questionnaire answers without the interactive screens.
+Answers are option numbers, one per question, and are scored in bulk
+by indexing a (questions x options) score matrix with NumPy
+
+Run as a script to score answers streamed from CSV or JSONL files, for
+example to re-score historical co2_scores rows when weights change
+"""
+
+# Imported library dependencies from the standard library
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+
+# Imported library dependencies from third party sources
+import numpy as np
+
+# Custom imports developed for the application
+import questionnaire
+
+# Rows scored at a time when streaming files
+CHUNK_SIZE = 100000
+
+
+class ScoreMatrix:
+    """
+    Creates a score matrix from questionnaire questions, padding the
+    options of questions with fewer options
+    """
+    def __init__(self, questions):
+        self.num_questions = len(questions)
+        self.num_options = np.array([len(question.scores)
+                                     for question in questions])
+        self.scores = np.full((self.num_questions, self.num_options.max()),
+                              -1, dtype=np.int64)
+        for index, question in enumerate(questions):
+            self.scores[index, :len(question.scores)] = question.scores
+        self.max_scores = np.array([question.max_poss_score
+                                    for question in questions])
+        self.max_total = int(self.max_scores.sum())
+
+    def check_shape(self, values):
+        """
+        Return values as a 2-D integer array with a column per question
+        """
+        values = np.atleast_2d(np.asarray(values, dtype=np.int64))
+        if values.shape[1] != self.num_questions:
+            raise ValueError(f"Expected {self.num_questions} answers per "
+                             f"row, got {values.shape[1]}")
+        return values
+
+    def score(self, answers):
+        """
+        Return the per question scores and total for rows of option
+        numbers, counting options from 1
+        """
+        answers = self.check_shape(answers)
+        if ((answers < 1) | (answers > self.num_options)).any():
+            raise ValueError("Answer out of range of the question options")
+        scores = self.scores[np.arange(self.num_questions), answers - 1]
+        return scores, scores.sum(axis=1)
+
+    def answers_from_scores(self, scores):
+        """
+        Return the option numbers that give rows of per question scores,
+        taking the first option where two options share a score
+        """
+        scores = self.check_shape(scores)
+        matches = self.scores[np.newaxis, :, :] == scores[:, :, np.newaxis]
+        if not matches.any(axis=2).all():
+            raise ValueError("Score does not match any question option")
+        return matches.argmax(axis=2) + 1
+
+
+def load_matrix(snapshot_path):
+    """
+    Return the score matrix of the questionnaire in a snapshot file
+    """
+    compiled = questionnaire.load_snapshot(snapshot_path)
+    if compiled is None:
+        raise ValueError(f"No questionnaire snapshot at {snapshot_path}")
+    return ScoreMatrix(questionnaire.build_questionnaire(compiled)[
+        "questions"])
+
+
+def numeric(values):
+    """
+    Return True if every value is a whole number
+    """
+    return all(str(value).strip().lstrip("-").isdigit() for value in values)
+
+
+def record_answers(record, num_questions):
+    """
+    Return the key values and answers of a JSONL record, holding an
+    "answers" list or result_1 onwards columns as in a co2_scores export
+    """
+    if "answers" in record:
+        return ({key: value for key, value in record.items()
+                 if key != "answers"}, record["answers"])
+    result_keys = [f"result_{num}" for num in range(1, num_questions + 1)]
+    # The final score is derived from the results so is not carried
+    skipped = set(result_keys) | {"final_score"}
+    return ({key: value for key, value in record.items()
+             if key not in skipped},
+            [int(record[key]) for key in result_keys])
+
+
+def csv_rows(input_file, keys, num_questions):
+    """
+    Return the header row of a CSV file, or None if the first row holds
+    answers, and the rows of answers
+    """
+    rows = csv.reader(input_file)
+    first = next(rows, None)
+    if first is None:
+        return None, rows
+    if numeric(first[keys:keys + num_questions]):
+        return None, itertools.chain([first], rows)
+    return first, rows
+
+
+def read_chunks(source, file_format, keys, num_questions, chunk_size):
+    """
+    Yield chunks of (key values, answers) from the rows of a CSV file
+    returned by csv_rows or the lines of a JSONL file. CSV rows hold
+    the key columns then a column per question. JSONL lines hold an
+    "answers" list alone or in an object with other keys, or the
+    result_1 onwards columns of a co2_scores export
+    """
+    if file_format == "csv":
+        rows = source
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield ([row[:keys] for row in chunk],
+                   np.array([row[keys:keys + num_questions]
+                             for row in chunk]).astype(np.int64))
+    else:
+        lines = (line for line in source if line.strip())
+        while True:
+            chunk = [json.loads(line) for line in
+                     itertools.islice(lines, chunk_size)]
+            if not chunk:
+                return
+            # A line may also be just the list of answers
+            chunk = [record_answers({"answers": record}
+                                    if isinstance(record, list) else record,
+                                    num_questions) for record in chunk]
+            yield ([key_values for key_values, _ in chunk],
+                   np.array([answers for _, answers in chunk],
+                            dtype=np.int64))
+
+
+def write_header(output_file, key_names, num_questions):
+    """
+    Write the header row of a scored CSV file
+    """
+    csv.writer(output_file).writerow(
+        list(key_names)
+        + [f"score_{num}" for num in range(1, num_questions + 1)]
+        + ["total", "max_total"])
+
+
+def write_chunk(output_file, file_format, key_values, scores, totals,
+                max_total):
+    """
+    Write scored rows in the same format as they were read
+    """
+    if file_format == "csv":
+        writer = csv.writer(output_file)
+        writer.writerows(
+            keys + row + [total, max_total] for keys, row, total in
+            zip(key_values, scores.tolist(), totals.tolist()))
+    else:
+        for keys, row, total in zip(key_values, scores.tolist(),
+                                    totals.tolist()):
+            record = dict(keys, scores=row, total=total,
+                          max_total=max_total)
+            output_file.write(json.dumps(record) + "\n")
+
+
+def score_file(input_file, output_file, file_format, matrix,
+               old_matrix=None, keys=0, chunk_size=CHUNK_SIZE):
+    """
+    Score every row of an input file, writing the results, returning
+    the number of rows scored. With an old matrix the input holds
+    per question scores under the old weights instead of answers.
+    A CSV output has a header row when the input had one
+    """
+    source = input_file
+    if file_format == "csv":
+        header, source = csv_rows(input_file, keys, matrix.num_questions)
+        if header is not None:
+            write_header(output_file, header[:keys], matrix.num_questions)
+    count = 0
+    for key_values, values in read_chunks(source, file_format, keys,
+                                          matrix.num_questions, chunk_size):
+        if old_matrix is not None:
+            values = old_matrix.answers_from_scores(values)
+        scores, totals = matrix.score(values)
+        write_chunk(output_file, file_format, key_values, scores, totals,
+                    matrix.max_total)
+        count += len(totals)
+    return count
+
+
+def main():
+    """
+    Score answers from a CSV or JSONL file or standard input
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("input", help='answers file, "-" for stdin')
+    parser.add_argument("-o", "--output", default="-",
+                        help='scored file, "-" for stdout')
+    parser.add_argument("--format", choices=("csv", "jsonl"),
+                        help="file format, by default from the extension")
+    parser.add_argument("--snapshot", default=questionnaire.SNAPSHOT_PATH,
+                        help="questionnaire snapshot to score with")
+    parser.add_argument("--from-scores", metavar="OLD_SNAPSHOT",
+                        help="input holds scores under this questionnaire")
+    parser.add_argument("--keys", type=int, default=0,
+                        help="leading CSV columns to carry through")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    file_format = args.format or (
+        "jsonl" if os.path.splitext(args.input)[1] == ".jsonl" else "csv")
+    matrix = load_matrix(args.snapshot)
+    old_matrix = load_matrix(args.from_scores) if args.from_scores else None
+    input_file = (sys.stdin if args.input == "-" else
+                  open(args.input, newline="", encoding="utf-8"))
+    output_file = (sys.stdout if args.output == "-" else
+                   open(args.output, "w", newline="", encoding="utf-8"))
+    with input_file, output_file:
+        count = score_file(input_file, output_file, file_format, matrix,
+                           old_matrix, args.keys, args.chunk_size)
+    print(f"Scored {count} rows", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
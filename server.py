@@ -0,0 +1,131 @@
+"""
+Module to serve many concurrent questionnaire sessions from one process
+over TCP. Sessions share the questionnaire, storage and rendered frames
+loaded by run.py and each has its own screen buffer and user state
+"""
+
+# Imported library dependencies from the standard library
+import asyncio
+import atexit
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Custom imports developed for the application
+import gui
+import run
+
+# Address the server listens on unless set in the environment
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8023
+
+# Sessions running at once, later connections are told the server is
+# busy and queued until a session ends
+MAX_SESSIONS = 200
+
+# Line sent to a connection queued behind MAX_SESSIONS running sessions
+BUSY_MESSAGE = "Server busy, you will be connected when a session ends\r\n"
+
+
+class SessionTerminal:
+    """
+    Connects the screen buffer of a session, running in a worker
+    thread, to its connection served by the event loop
+    """
+    def __init__(self, loop, reader, writer):
+        self.loop = loop
+        self.reader = reader
+        self.writer = writer
+
+    def write(self, text):
+        """
+        Queue text to be sent to the client. Line feeds are sent as
+        carriage return and line feed, as a terminal would translate
+        them, so frames keep to the left edge of the client
+        """
+        self.loop.call_soon_threadsafe(
+            self.writer.write, text.replace("\n", "\r\n").encode("utf-8"))
+
+    def flush(self):
+        """
+        Wait until the client has taken the queued output
+        """
+        asyncio.run_coroutine_threadsafe(self.writer.drain(),
+                                         self.loop).result()
+
+    def read_line(self):
+        """
+        Wait for a line of input from the client
+        """
+        line = asyncio.run_coroutine_threadsafe(self.reader.readline(),
+                                                self.loop).result()
+        if not line:
+            raise EOFError("Client disconnected")
+        return line.decode("utf-8", "replace").rstrip("\r\n")
+
+
+def run_session(terminal):
+    """
+    Run one questionnaire session against its own screen buffer
+    """
+    gui.current_screen.set(gui.ScreenBuffer(stream=terminal,
+                                            read_line=terminal.read_line))
+    try:
+        run.main()
+    except (EOFError, ConnectionError):
+        pass
+
+
+async def handle_connection(reader, writer, executor, slots):
+    """
+    Run a session for a new connection once a slot is free and close
+    the connection when done
+    """
+    loop = asyncio.get_running_loop()
+    terminal = SessionTerminal(loop, reader, writer)
+    # Each session gets its own copy of the context for its screen
+    context = contextvars.copy_context()
+    try:
+        if slots.locked():
+            writer.write(BUSY_MESSAGE.encode("utf-8"))
+        async with slots:
+            await loop.run_in_executor(executor, context.run, run_session,
+                                       terminal)
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def serve(host, port, max_sessions=MAX_SESSIONS):
+    """
+    Accept connections and run a session for each until cancelled
+    """
+    executor = ThreadPoolExecutor(max_workers=max_sessions,
+                                  thread_name_prefix="session")
+    slots = asyncio.Semaphore(max_sessions)
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_connection(reader, writer, executor,
+                                                 slots),
+        host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    """
+    Serve sessions on the address in CO2_SERVER_HOST and CO2_SERVER_PORT
+    """
+    host = os.environ.get("CO2_SERVER_HOST", DEFAULT_HOST)
+    port = int(os.environ.get("CO2_SERVER_PORT", DEFAULT_PORT))
+    atexit.register(run.startup_report)
+    try:
+        asyncio.run(serve(host, port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
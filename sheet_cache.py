@@ -0,0 +1,251 @@
+"""
+Module to keep a local read-through copy of a worksheet so that rows can
+be looked up by the value in their first column without a network call
+"""
+
+# Imported library dependencies from the standard library
+import re
+import time
+
+# Seconds a loaded copy of the worksheet is trusted before reloading
+DEFAULT_TTL = 60
+
+# Pulls the first row number out of an A1 range such as "co2_scores!A5:O5"
+updated_row_pattern = re.compile(r"![A-Z]+(\d+)")
+
+# Times the rows of a write are resolved before giving up when other
+# processes keep moving them
+MAX_ATTEMPTS = 3
+
+
+class RowMovedError(Exception):
+    """
+    Raised when the rows to write keep moving while they are checked
+    """
+
+
+class MissingRowError(LookupError):
+    """
+    Raised when a row to overwrite is not in the worksheet
+    """
+
+
+def cell_value(value_range):
+    """
+    Return the value of a single cell range read with batch_get
+    """
+    return value_range[0][0] if value_range and value_range[0] else ""
+
+
+class WorksheetCache:
+    """
+    Creates a local copy of a worksheet indexed by its first column.
+    Writes made through the cache go to the worksheet and are applied
+    to the local copy so it stays consistent. Rows written by number
+    are checked first as other processes may have moved them
+    """
+    def __init__(self, worksheet, ttl=DEFAULT_TTL):
+        self.worksheet = worksheet
+        self.ttl = ttl
+        self.rows = []
+        self.index = {}
+        self.loaded_at = None
+
+    def refresh(self):
+        """
+        Load the whole worksheet in one request and index it
+        """
+        self.rows = self.worksheet.get_all_values()
+        self.index = {}
+        for row_number, row in enumerate(self.rows, start=1):
+            if row and row[0]:
+                self.index.setdefault(row[0], row_number)
+        self.loaded_at = time.monotonic()
+
+    def ensure_fresh(self):
+        """
+        Reload the worksheet if it has not been loaded or is older
+        than the time to live
+        """
+        if (self.loaded_at is None
+                or time.monotonic() - self.loaded_at > self.ttl):
+            self.refresh()
+
+    def row_number(self, key):
+        """
+        Return the worksheet row number holding the key or None
+        """
+        self.ensure_fresh()
+        return self.index.get(key)
+
+    def key_row_numbers(self):
+        """
+        Return the worksheet row number of each key, read from the
+        first column of the worksheet in one request without loading
+        the other columns
+        """
+        row_numbers = {}
+        for row_number, cells in enumerate(
+                self.worksheet.batch_get(["A:A"])[0], start=1):
+            if cells and cells[0]:
+                row_numbers.setdefault(cells[0], row_number)
+        return row_numbers
+
+    def checked_row_numbers(self, keys):
+        """
+        Return the worksheet row number of each key found, checked
+        against the first column of the worksheet in one request as
+        other processes may have moved rows since the copy was loaded.
+        When a row has moved the worksheet is reloaded and the rows
+        resolved again
+        """
+        for _ in range(MAX_ATTEMPTS):
+            row_numbers = {}
+            for key in keys:
+                row_number = self.row_number(key)
+                if row_number is not None:
+                    row_numbers[key] = row_number
+            if not row_numbers:
+                return row_numbers
+            key_cells = self.worksheet.batch_get(
+                [f"A{row_number}" for row_number in row_numbers.values()])
+            if all(cell_value(key_cell) == key
+                   for key, key_cell in zip(row_numbers, key_cells)):
+                return row_numbers
+            self.refresh()
+        raise RowMovedError(f"Rows kept moving while writing {list(keys)}")
+
+    def find(self, key):
+        """
+        Return a copy of the row values holding the key or None
+        """
+        row_number = self.row_number(key)
+        if row_number is None:
+            return None
+        return list(self.rows[row_number - 1])
+
+    def all_rows(self):
+        """
+        Return copies of every row in the worksheet
+        """
+        self.ensure_fresh()
+        return [list(row) for row in self.rows]
+
+    def keys(self):
+        """
+        Return the set of keys held in the first column
+        """
+        self.ensure_fresh()
+        return self.index.keys()
+
+    def append_row(self, values):
+        """
+        Add a row to the end of the worksheet
+        """
+        self.append_rows([values])
+
+    def append_rows(self, rows):
+        """
+        Add rows to the end of the worksheet in one request
+        """
+        self.ensure_fresh()
+        response = self.worksheet.append_rows(rows)
+        match = None
+        if isinstance(response, dict):
+            updated_range = response.get("updates", {}).get("updatedRange")
+            match = updated_row_pattern.search(updated_range or "")
+        if match is None:
+            # Where the rows went is unknown so reload on next use
+            self.loaded_at = None
+            return
+        first_row = int(match.group(1))
+        while len(self.rows) < first_row + len(rows) - 1:
+            self.rows.append([])
+        for row_number, values in enumerate(rows, start=first_row):
+            self.rows[row_number - 1] = [str(value) for value in values]
+            self.index.setdefault(str(values[0]), row_number)
+
+    def update_row(self, values):
+        """
+        Overwrite the row holding the key in the first value, raising
+        MissingRowError if the key is not in the worksheet
+        """
+        self.update_rows([values])
+
+    def update_rows(self, rows):
+        """
+        Overwrite the rows holding the keys in the first value of each
+        row in one request, raising MissingRowError before writing
+        anything if a key is not in the worksheet
+        """
+        updates = []
+        row_numbers = []
+        checked = self.checked_row_numbers(
+            list(dict.fromkeys(str(values[0]) for values in rows)))
+        missing = [values[0] for values in rows
+                   if str(values[0]) not in checked]
+        if missing:
+            raise MissingRowError(f"No rows to overwrite for {missing}")
+        for values in rows:
+            row_number = checked[str(values[0])]
+            last_col = chr(ord("A") + len(values) - 1)
+            updates.append({
+                "range": f"A{row_number}:{last_col}{row_number}",
+                "values": [values]
+            })
+            row_numbers.append((row_number, values))
+        if updates:
+            self.worksheet.batch_update(updates)
+        for row_number, values in row_numbers:
+            self.rows[row_number - 1] = [str(value) for value in values]
+
+    def save_rows(self, rows):
+        """
+        Overwrite the rows holding the keys in the first value of each
+        row and add the others to the end of the worksheet. Existing
+        rows are found from a fresh read of the first column as other
+        processes may have added or moved rows since the copy was
+        loaded. The copy is kept only if the worksheet still matches it
+        """
+        row_numbers = self.key_row_numbers()
+        in_step = self.loaded_at is not None and row_numbers == self.index
+        updates = []
+        new = {}
+        for values in rows:
+            row_number = row_numbers.get(str(values[0]))
+            if row_number is None:
+                new[str(values[0])] = values
+                continue
+            last_col = chr(ord("A") + len(values) - 1)
+            updates.append({
+                "range": f"A{row_number}:{last_col}{row_number}",
+                "values": [values]
+            })
+            if in_step:
+                self.rows[row_number - 1] = [str(value) for value in values]
+        if updates:
+            self.worksheet.batch_update(updates)
+        if not in_step:
+            # Reload on next use rather than load every row here
+            self.loaded_at = None
+            if new:
+                self.worksheet.append_rows(list(new.values()))
+        elif new:
+            self.append_rows(list(new.values()))
+
+    def delete_row(self, key):
+        """
+        Delete the row holding the key, returning False
+        if the key is not in the worksheet
+        """
+        row_number = self.checked_row_numbers([key]).get(key)
+        if row_number is None:
+            return False
+        self.worksheet.delete_rows(row_number)
+        del self.rows[row_number - 1]
+        del self.index[key]
+        # Rows below the deleted row move up by one
+        for other_key, other_row in self.index.items():
+            if other_row > row_number:
+                self.index[other_key] = other_row - 1
+        return True
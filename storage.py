@@ -0,0 +1,394 @@
+"""
+Module providing the storage backends that hold the questionnaire and
+the users' co2 scores. Rows are lists of strings laid out as in the
+co2_scores worksheet: user id, date, 12 results and the final score
+"""
+
+# Imported library dependencies from the standard library
+import os
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+# Custom imports developed for the application
+import sheet_cache
+
+# SCOPE definition code provided by Code Institute
+SCOPE = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive.file",
+    "https://www.googleapis.com/auth/drive"
+    ]
+
+# Number of results stored for each user
+NUM_OF_RESULTS = 12
+
+# Storage used when CO2_STORAGE is not set
+DEFAULT_STORAGE = "sheets"
+
+
+def valid_user_id(user_id):
+    """
+    Return True if the user id has the 5 alphanumeric character format
+    of allocated ids, which the worksheet header row does not
+    """
+    return len(user_id) == 5 and user_id.isalnum()
+
+
+class UserProfile:
+    """
+    Creates the profile of a stored user from their row, with the
+    results and final score as integers
+    """
+    def __init__(self, row):
+        self.user_id = row[0]
+        self.date = row[1]
+        self.results = list(map(int, row[2:2 + NUM_OF_RESULTS]))
+        self.final_score = int(row[2 + NUM_OF_RESULTS])
+
+    def deltas(self, results):
+        """
+        Return the change of each result from the stored result
+        """
+        return [result - stored for result, stored
+                in zip(results, self.results)]
+
+
+class Storage:
+    """
+    Defines the operations every storage backend provides
+    """
+    def questionnaire_rows(self):
+        """
+        Return the questionnaire as rows of label, detail and score
+        """
+        raise NotImplementedError
+
+    def find_user(self, user_id):
+        """
+        Return the stored row for a user id or None
+        """
+        raise NotImplementedError
+
+    def user_exists(self, user_id):
+        """
+        Return True if a row is stored for the user id
+        """
+        return self.find_user(user_id) is not None
+
+    def user_profile(self, user_id):
+        """
+        Return the profile of a user from a single read or None,
+        including when the stored row cannot be read as results
+        """
+        row = self.find_user(user_id)
+        if row is None:
+            return None
+        try:
+            return UserProfile(row)
+        except (IndexError, ValueError):
+            return None
+
+    def count_users(self):
+        """
+        Return the number of users stored
+        """
+        raise NotImplementedError
+
+    def all_users(self):
+        """
+        Return the stored rows of every user
+        """
+        raise NotImplementedError
+
+    def users_chunk(self, offset, limit):
+        """
+        Return up to limit stored rows starting at offset, fewer only
+        at the end of the rows. Blank rows may be returned as empty lists
+        """
+        return self.all_users()[offset:offset + limit]
+
+    def set_questionnaire_rows(self, rows):
+        """
+        Replace the stored questionnaire with rows of
+        label, detail and score
+        """
+        raise NotImplementedError
+
+    def add_user(self, row):
+        """
+        Store the row of a new user
+        """
+        raise NotImplementedError
+
+    def update_user(self, row):
+        """
+        Overwrite the stored row of an existing user
+        """
+        raise NotImplementedError
+
+    def save_users(self, rows):
+        """
+        Store a batch of rows, adding new users and updating
+        existing ones
+        """
+        for row in rows:
+            if self.user_exists(row[0]):
+                self.update_user(row)
+            else:
+                self.add_user(row)
+
+    def import_users(self, rows):
+        """
+        Store a batch of rows as save_users does, for bulk imports that
+        should not hold every stored row in memory
+        """
+        self.save_users(rows)
+
+    def delete_user(self, user_id):
+        """
+        Delete the stored row of a user
+        """
+        raise NotImplementedError
+
+
+class GoogleSheetsStorage(Storage):
+    """
+    Creates storage backed by the co2_score Google Sheets spreadsheet
+    """
+    def __init__(self, creds_file="creds.json", sheet_name="co2_score",
+                 gspread_client=None):
+        if gspread_client is None:
+            # Imported here so other backends run without Google libraries
+            import gspread
+            from google.oauth2.service_account import Credentials
+
+            # Code to access Google Sheets provided by code institute
+            # Code Institute code begins here
+            creds = Credentials.from_service_account_file(creds_file)
+            scoped_creds = creds.with_scopes(SCOPE)
+            gspread_client = gspread.authorize(scoped_creds)
+            # Code Institute code ends here
+        self.co2_sheet = gspread_client.open(sheet_name)
+
+        # Local copy of the co2_scores worksheet indexed by user id so
+        # that lookups need no round trip to the sheet
+        self.co2_scores = sheet_cache.WorksheetCache(
+            self.co2_sheet.worksheet("co2_scores"))
+
+    def questionnaire_rows(self):
+        return self.co2_sheet.worksheet("questionnaire").get_all_values()
+
+    def find_user(self, user_id):
+        # The header row is not a valid user id
+        if not valid_user_id(user_id):
+            return None
+        return self.co2_scores.find(user_id)
+
+    def user_exists(self, user_id):
+        if not valid_user_id(user_id):
+            return False
+        return self.co2_scores.row_number(user_id) is not None
+
+    def count_users(self):
+        return sum(1 for user_id in self.co2_scores.keys()
+                   if valid_user_id(user_id))
+
+    def all_users(self):
+        return [row for row in self.co2_scores.all_rows()
+                if row and valid_user_id(row[0])]
+
+    def users_chunk(self, offset, limit):
+        # Read straight from the worksheet so memory stays bounded by
+        # the chunk, users start below the header row
+        first_row = offset + 2
+        last_col = chr(ord("A") + NUM_OF_RESULTS + 2)
+        value_ranges = self.co2_scores.worksheet.batch_get(
+            [f"A{first_row}:{last_col}{first_row + limit - 1}"])
+        return [list(row) for row in value_ranges[0]]
+
+    def set_questionnaire_rows(self, rows):
+        worksheet = self.co2_sheet.worksheet("questionnaire")
+        worksheet.clear()
+        worksheet.update("A1", rows)
+
+    def add_user(self, row):
+        self.co2_scores.append_row(row)
+
+    def update_user(self, row):
+        # Added again if another process deleted the user meanwhile
+        self.co2_scores.save_rows([row])
+
+    def save_users(self, rows):
+        # Only the user id column is read to find existing users, so
+        # imports also run without holding every row in memory
+        self.co2_scores.save_rows(rows)
+
+    def delete_user(self, user_id):
+        self.co2_scores.delete_row(user_id)
+
+
+class SQLiteStorage(Storage):
+    """
+    Creates storage in a local SQLite database file
+    """
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        result_columns = ", ".join(f"result_{num} INTEGER" for num in
+                                   range(1, NUM_OF_RESULTS + 1))
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS co2_scores ("
+                "user_id TEXT PRIMARY KEY, date TEXT, "
+                f"{result_columns}, final_score INTEGER)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS questionnaire ("
+                "position INTEGER PRIMARY KEY, label TEXT, "
+                "detail TEXT, score TEXT)")
+        self.placeholders = ", ".join("?" * (NUM_OF_RESULTS + 3))
+
+    def questionnaire_rows(self):
+        cursor = self.connection.execute(
+            "SELECT label, detail, score FROM questionnaire "
+            "ORDER BY position")
+        return [list(row) for row in cursor]
+
+    def set_questionnaire_rows(self, rows):
+        with self.connection:
+            self.connection.execute("DELETE FROM questionnaire")
+            self.connection.executemany(
+                "INSERT INTO questionnaire VALUES (?, ?, ?, ?)",
+                [(position, *(list(row) + ["", "", ""])[:3])
+                 for position, row in enumerate(rows)])
+
+    def find_user(self, user_id):
+        row = self.connection.execute(
+            "SELECT * FROM co2_scores WHERE user_id = ?",
+            (user_id,)).fetchone()
+        if row is None:
+            return None
+        return [str(value) for value in row]
+
+    def count_users(self):
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM co2_scores").fetchone()[0]
+
+    def all_users(self):
+        cursor = self.connection.execute("SELECT * FROM co2_scores")
+        return [[str(value) for value in row] for row in cursor]
+
+    def users_chunk(self, offset, limit):
+        cursor = self.connection.execute(
+            "SELECT * FROM co2_scores ORDER BY rowid LIMIT ? OFFSET ?",
+            (limit, offset))
+        return [[str(value) for value in row] for row in cursor]
+
+    def add_user(self, row):
+        with self.connection:
+            self.connection.execute(
+                f"INSERT INTO co2_scores VALUES ({self.placeholders})", row)
+
+    def update_user(self, row):
+        with self.connection:
+            self.connection.execute(
+                f"REPLACE INTO co2_scores VALUES ({self.placeholders})", row)
+
+    def save_users(self, rows):
+        with self.connection:
+            self.connection.executemany(
+                f"REPLACE INTO co2_scores VALUES ({self.placeholders})", rows)
+
+    def delete_user(self, user_id):
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM co2_scores WHERE user_id = ?", (user_id,))
+
+
+class DeferredStorage(Storage):
+    """
+    Creates storage that is opened in the background, blocking
+    callers only when they first use it
+    """
+    def __init__(self, location=None):
+        self.future = run_in_background(open_storage, location)
+
+    def backend(self):
+        """
+        Return the opened storage, waiting for it if necessary
+        """
+        return self.future.result()
+
+    def questionnaire_rows(self):
+        return self.backend().questionnaire_rows()
+
+    def find_user(self, user_id):
+        return self.backend().find_user(user_id)
+
+    def user_exists(self, user_id):
+        return self.backend().user_exists(user_id)
+
+    def count_users(self):
+        return self.backend().count_users()
+
+    def all_users(self):
+        return self.backend().all_users()
+
+    def users_chunk(self, offset, limit):
+        return self.backend().users_chunk(offset, limit)
+
+    def set_questionnaire_rows(self, rows):
+        self.backend().set_questionnaire_rows(rows)
+
+    def add_user(self, row):
+        self.backend().add_user(row)
+
+    def update_user(self, row):
+        self.backend().update_user(row)
+
+    def save_users(self, rows):
+        self.backend().save_users(rows)
+
+    def import_users(self, rows):
+        self.backend().import_users(rows)
+
+    def delete_user(self, user_id):
+        self.backend().delete_user(user_id)
+
+
+def run_in_background(function, *args):
+    """
+    Call a function in a daemon thread and return a future for its
+    result so that a stalled network call cannot hold up exit
+    """
+    future = Future()
+
+    def worker():
+        try:
+            future.set_result(function(*args))
+        except Exception as error:  # pylint: disable=broad-except
+            future.set_exception(error)
+
+    threading.Thread(target=worker, daemon=True).start()
+    return future
+
+
+def open_storage(location=None):
+    """
+    Open the storage named by location or the CO2_STORAGE environment
+    variable, either "sheets", "sqlite:<path to database file>" or
+    "fakesheets" for an in-process stand-in for Google Sheets
+    """
+    if location is None:
+        location = os.environ.get("CO2_STORAGE", DEFAULT_STORAGE)
+    if location == "sheets":
+        return GoogleSheetsStorage()
+    if location == "fakesheets":
+        # Imported here as the stand-in is only used for testing
+        import fakesheets  # pylint: disable=import-outside-toplevel
+        return GoogleSheetsStorage(
+            gspread_client=fakesheets.shared_client())
+    if location.startswith("sqlite:"):
+        return SQLiteStorage(location[len("sqlite:"):])
+    raise ValueError(f"Unknown storage: {location}")
@@ -0,0 +1,278 @@
+"""
+Module to move the co2_scores and questionnaire worksheets between
+storage and CSV or JSONL files, or from one storage to another, for
+backups, migrations and test fixtures. Users move in chunks so memory
+stays bounded and an interrupted transfer resumes from its checkpoint
+"""
+
+# Imported library dependencies from the standard library
+import argparse
+import csv
+import itertools
+import json
+import os
+
+# Custom imports developed for the application
+import files
+import storage
+
+# Users read or written per request
+CHUNK_SIZE = 500
+
+# Column names of the co2_scores and questionnaire worksheets
+USER_FIELDS = (["user_id", "date"]
+               + [f"result_{num}" for num in
+                  range(1, storage.NUM_OF_RESULTS + 1)]
+               + ["final_score"])
+QUESTIONNAIRE_FIELDS = ["label", "detail", "score"]
+
+
+def file_format(path):
+    """
+    Return the format of a file from its extension, CSV unless .jsonl
+    """
+    return "jsonl" if os.path.splitext(path)[1] == ".jsonl" else "csv"
+
+
+def pad(row, fields):
+    """
+    Return the row as strings with blank cells for trailing empty columns
+    """
+    return ([str(value) for value in row] + [""] * len(fields))[:len(fields)]
+
+
+def write_rows(output_file, fields, rows, write_header=False):
+    """
+    Write rows to a CSV or JSONL file, a JSONL line holding an object
+    keyed by the field names
+    """
+    if file_format(output_file.name) == "jsonl":
+        for row in rows:
+            output_file.write(json.dumps(dict(zip(fields, pad(row, fields))))
+                              + "\n")
+        return
+    writer = csv.writer(output_file)
+    if write_header:
+        writer.writerow(fields)
+    writer.writerows(pad(row, fields) for row in rows)
+
+
+def read_rows(input_file, fields):
+    """
+    Yield the rows of a CSV or JSONL file as lists of strings,
+    skipping a CSV header row
+    """
+    if file_format(input_file.name) == "jsonl":
+        for line in input_file:
+            if line.strip():
+                record = json.loads(line)
+                yield [str(record.get(field, "")) for field in fields]
+        return
+    for row in csv.reader(input_file):
+        if row != fields:
+            yield pad(row, fields)
+
+
+def user_row(row):
+    """
+    Return a user row as it is stored by the application, with
+    integer results and the final score as a string
+    """
+    results = [int(value) if value.lstrip("-").isdigit() else value
+               for value in row[2:2 + storage.NUM_OF_RESULTS]]
+    return row[:2] + results + [row[-1]]
+
+
+def chunked(rows, chunk_size):
+    """
+    Yield lists of up to chunk_size rows
+    """
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def load_checkpoint(checkpoint_path, job):
+    """
+    Return the progress saved for the job or a new start when there is
+    no checkpoint or it belongs to another job
+    """
+    try:
+        with open(checkpoint_path, encoding="utf-8") as checkpoint:
+            state = json.load(checkpoint)
+    except (OSError, ValueError):
+        state = {}
+    if state.get("job") != job:
+        state = {"job": job, "offset": 0, "size": 0}
+    return state
+
+
+def save_checkpoint(checkpoint_path, state):
+    """
+    Write the progress of a job to its checkpoint file
+    """
+    files.atomic_write(checkpoint_path,
+                       lambda checkpoint: json.dump(state, checkpoint))
+
+
+def remove_checkpoint(checkpoint_path):
+    """
+    Remove the checkpoint of a finished job
+    """
+    try:
+        os.remove(checkpoint_path)
+    except FileNotFoundError:
+        pass
+
+
+def storage_users(source, offset, chunk_size):
+    """
+    Yield chunks of users from storage starting at the offset, each
+    with the offset to resume from once the chunk is transferred
+    """
+    while True:
+        rows = source.users_chunk(offset, chunk_size)
+        offset += len(rows)
+        yield [row for row in rows if row and row[0]], offset
+        if len(rows) < chunk_size:
+            return
+
+
+def export_users(source, path, checkpoint_path, chunk_size=CHUNK_SIZE):
+    """
+    Write every user in storage to a file, returning the number written
+    """
+    state = load_checkpoint(checkpoint_path, ["export", path])
+    if state["size"] and not os.path.exists(path):
+        # The partial export was removed so start again
+        remove_checkpoint(checkpoint_path)
+        state = load_checkpoint(checkpoint_path, ["export", path])
+    if state["size"]:
+        # Drop anything written after the last checkpoint
+        os.truncate(path, state["size"])
+    count = 0
+    with open(path, "a" if state["size"] else "w", newline="",
+              encoding="utf-8") as output_file:
+        if not state["size"]:
+            write_rows(output_file, USER_FIELDS, [], True)
+        for users, offset in storage_users(source, state["offset"],
+                                           chunk_size):
+            write_rows(output_file, USER_FIELDS, users)
+            output_file.flush()
+            os.fsync(output_file.fileno())
+            count += len(users)
+            state["offset"] = offset
+            state["size"] = output_file.tell()
+            save_checkpoint(checkpoint_path, state)
+    remove_checkpoint(checkpoint_path)
+    return count
+
+
+def import_users(target, path, checkpoint_path, chunk_size=CHUNK_SIZE):
+    """
+    Store every user in a file, adding new users and overwriting
+    existing ones, returning the number stored
+    """
+    state = load_checkpoint(checkpoint_path, ["import", path])
+    count = 0
+    with open(path, newline="", encoding="utf-8") as input_file:
+        rows = itertools.islice(read_rows(input_file, USER_FIELDS),
+                                state["offset"], None)
+        for users in chunked(rows, chunk_size):
+            target.import_users([user_row(row) for row in users])
+            count += len(users)
+            state["offset"] += len(users)
+            save_checkpoint(checkpoint_path, state)
+    remove_checkpoint(checkpoint_path)
+    return count
+
+
+def copy_users(source, target, checkpoint_path, chunk_size=CHUNK_SIZE):
+    """
+    Store every user of one storage in another, returning the number
+    copied
+    """
+    state = load_checkpoint(checkpoint_path, ["copy"])
+    count = 0
+    for users, offset in storage_users(source, state["offset"], chunk_size):
+        if users:
+            target.import_users([user_row(pad(row, USER_FIELDS))
+                                 for row in users])
+        count += len(users)
+        state["offset"] = offset
+        save_checkpoint(checkpoint_path, state)
+    remove_checkpoint(checkpoint_path)
+    return count
+
+
+def export_questionnaire(source, path):
+    """
+    Write the questionnaire to a file, returning the number of rows
+    """
+    rows = source.questionnaire_rows()
+    with open(path, "w", newline="", encoding="utf-8") as output_file:
+        write_rows(output_file, QUESTIONNAIRE_FIELDS, rows, True)
+    return len(rows)
+
+
+def import_questionnaire(target, path):
+    """
+    Replace the questionnaire in storage with the rows of a file,
+    returning the number of rows
+    """
+    with open(path, newline="", encoding="utf-8") as input_file:
+        rows = list(read_rows(input_file, QUESTIONNAIRE_FIELDS))
+    target.set_questionnaire_rows(rows)
+    return len(rows)
+
+
+def main():
+    """
+    Export, import or copy a worksheet of the configured storage
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("action", choices=("export", "import", "copy"))
+    parser.add_argument("worksheet", choices=("co2_scores", "questionnaire"))
+    parser.add_argument("path", nargs="?",
+                        help="CSV or JSONL file to export to or import from")
+    parser.add_argument("--storage", help="storage location, by default "
+                        "from CO2_STORAGE")
+    parser.add_argument("--to", help="storage location to copy to")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--checkpoint", help="progress file, by default "
+                        "next to the file being transferred")
+    args = parser.parse_args()
+    if (args.action == "copy") != (args.path is None):
+        parser.error("copy takes --to, export and import take a path")
+    if args.action == "copy" and args.to is None:
+        parser.error("copy needs --to")
+    checkpoint_path = args.checkpoint or (
+        f"{args.path}.checkpoint" if args.path else "copy.checkpoint")
+
+    co2_storage = storage.open_storage(args.storage)
+    if args.action == "copy":
+        target = storage.open_storage(args.to)
+        if args.worksheet == "questionnaire":
+            rows = co2_storage.questionnaire_rows()
+            target.set_questionnaire_rows(rows)
+            count = len(rows)
+        else:
+            count = copy_users(co2_storage, target, checkpoint_path,
+                               args.chunk_size)
+    elif args.worksheet == "questionnaire":
+        transfer = (export_questionnaire if args.action == "export"
+                    else import_questionnaire)
+        count = transfer(co2_storage, args.path)
+    else:
+        transfer = export_users if args.action == "export" else import_users
+        count = transfer(co2_storage, args.path, checkpoint_path,
+                         args.chunk_size)
+    done = {"export": "Exported", "import": "Imported", "copy": "Copied"}
+    print(f"{done[args.action]} {count} {args.worksheet} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Module to allocate unique 5 character alphanumeric user ids by walking
+a keyed Feistel permutation of every possible id, so that ids look
+random but are never repeated and need no remote lookups
+"""
+
+# Imported library dependencies from the standard library
+import hashlib
+import json
+import os
+import string
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# Characters user ids are made from
+ID_CHARACTERS = string.ascii_letters + string.digits
+
+ID_LENGTH = 5
+
+# Number of possible user ids, 62 ** 5
+ID_SPACE = len(ID_CHARACTERS) ** ID_LENGTH
+
+# The permutation runs over 30 bits, the smallest even number of bits
+# covering the id space, and walks again for values beyond the space
+HALF_BITS = 15
+HALF_MASK = (1 << HALF_BITS) - 1
+ROUNDS = 4
+
+# Permutation key and position in the sequence of ids shared by every
+# process on this machine
+STATE_PATH = "user_id_state.json"
+
+
+def encode_id(number):
+    """
+    Return the user id for a number in the id space
+    """
+    characters = []
+    for _ in range(ID_LENGTH):
+        number, index = divmod(number, len(ID_CHARACTERS))
+        characters.append(ID_CHARACTERS[index])
+    return "".join(reversed(characters))
+
+
+class FeistelPermutation:
+    """
+    Creates a keyed one to one mapping of the id space onto itself
+    """
+    def __init__(self, key):
+        self.key = key
+
+    def round_value(self, round_num, half):
+        """
+        Return the keyed round function output for one half
+        """
+        digest = hashlib.blake2b(bytes((round_num,)) + half.to_bytes(2, "big"),
+                                 key=self.key, digest_size=2).digest()
+        return int.from_bytes(digest, "big") & HALF_MASK
+
+    def permute(self, number):
+        """
+        Return the position of a number after permutation
+        """
+        while True:
+            left, right = number >> HALF_BITS, number & HALF_MASK
+            for round_num in range(ROUNDS):
+                left, right = right, left ^ self.round_value(round_num,
+                                                             right)
+            number = (left << HALF_BITS) | right
+            # Walking the cycle keeps the result inside the id space
+            if number < ID_SPACE:
+                return number
+
+
+class UserIdAllocator:
+    """
+    Creates an allocator handing out ids in permuted order, skipping
+    any id that storage already holds
+    """
+    def __init__(self, co2_storage, state_path=STATE_PATH):
+        self.co2_storage = co2_storage
+        self.state_path = state_path
+
+    def next_position(self):
+        """
+        Claim the next position in the sequence from the state file,
+        creating the state with a random key the first time
+        """
+        descriptor = os.open(self.state_path, os.O_RDWR | os.O_CREAT, 0o600)
+        with os.fdopen(descriptor, "r+", encoding="utf-8") as state_file:
+            if fcntl is not None:
+                fcntl.flock(state_file, fcntl.LOCK_EX)
+            try:
+                state = json.loads(state_file.read() or "{}")
+            except ValueError:
+                state = {}
+            key = os.environ.get("CO2_ID_KEY") or state.get("key")
+            if key is None:
+                key = os.urandom(16).hex()
+            position = state.get("position", 0)
+            state_file.seek(0)
+            state_file.truncate()
+            state_file.write(json.dumps({"key": key,
+                                         "position": position + 1}))
+        return key, position
+
+    def allocate(self):
+        """
+        Return a user id that is not held in storage
+        """
+        while True:
+            key, position = self.next_position()
+            permutation = FeistelPermutation(key.encode("utf-8"))
+            user_id = encode_id(permutation.permute(position % ID_SPACE))
+            if not self.co2_storage.user_exists(user_id):
+                return user_id
+
+    def fullness(self):
+        """
+        Return the number of ids in use and the fraction of
+        the id space that they fill
+        """
+        used = self.co2_storage.count_users()
+        return used, used / ID_SPACE
+
+
+def main():
+    """
+    Report how full the id space is for the configured storage
+    """
+    # Imported here so allocating ids does not depend on opening storage
+    import storage  # pylint: disable=import-outside-toplevel
+
+    used, fraction = UserIdAllocator(storage.open_storage()).fullness()
+    print(f"{used} of {ID_SPACE} user ids in use ({fraction:.6%})")
+
+
+if __name__ == "__main__":
+    main()
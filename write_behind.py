@@ -0,0 +1,278 @@
+"""
+Module to queue writes to storage in an append-only journal and apply
+them in batches from a background worker so users do not wait on them
+"""
+
+# Imported library dependencies from the standard library
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+
+# Custom imports developed for the application
+import files
+import storage
+
+# Seconds between flushes of queued writes to storage
+FLUSH_INTERVAL = 5
+
+# Longest wait in seconds between retries of a failed flush
+MAX_BACKOFF = 64
+
+# Directory holding one journal per running process
+JOURNAL_DIR = "journal"
+
+
+def pid_alive(pid):
+    """
+    Return True if a process with the pid is running
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def run_with_backoff(function, interval, delay_first=True):
+    """
+    Call a function every interval forever, backing off exponentially
+    while it raises, for example while storage cannot be reached or
+    the quota is used up
+    """
+    backoff = 0
+    if delay_first:
+        time.sleep(interval)
+    while True:
+        try:
+            function()
+        except Exception:  # pylint: disable=broad-except
+            backoff = min(max(backoff * 2, 1), MAX_BACKOFF)
+        else:
+            backoff = 0
+        time.sleep(backoff or interval)
+
+
+def batches(operations):
+    """
+    Group queued operations into runs of saves, keeping only the last
+    save for each user, and single deletes, preserving their order
+    """
+    grouped = []
+    for operation in operations:
+        if (operation["op"] == "save" and grouped
+                and grouped[-1][0] == "save"):
+            grouped[-1][1].append(operation)
+        else:
+            grouped.append((operation["op"], [operation]))
+    return grouped
+
+
+class WriteBehindStorage(storage.Storage):
+    """
+    Creates storage that records writes in a journal and applies them
+    to the wrapped storage in batches from a background worker. Reads
+    see queued writes before they reach the wrapped storage
+    """
+    def __init__(self, backend, journal_dir=JOURNAL_DIR,
+                 interval=FLUSH_INTERVAL):
+        self.backend = backend
+        self.interval = interval
+        self.queue = []
+        # Latest queued operation for each user id
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.flushed = threading.Condition(self.lock)
+        # Only one thread talks to the wrapped storage at a time
+        self.backend_lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        os.makedirs(journal_dir, exist_ok=True)
+        self.journal_path = os.path.join(journal_dir,
+                                         f"{os.getpid()}.jsonl")
+        self.journal = None
+        self.adopt_journals(journal_dir)
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+        atexit.register(self.close)
+
+    def adopt_journals(self, journal_dir):
+        """
+        Queue the writes left in journals of processes that
+        are no longer running
+        """
+        for path in sorted(glob.glob(os.path.join(journal_dir, "*.jsonl"))):
+            name = os.path.splitext(os.path.basename(path))[0]
+            if not name.isdigit() or (int(name) != os.getpid()
+                                      and pid_alive(int(name))):
+                continue
+            claimed_path = f"{path}.{os.getpid()}.claimed"
+            try:
+                os.rename(path, claimed_path)
+            except OSError:
+                # Another process adopted the journal first
+                continue
+            with open(claimed_path, encoding="utf-8") as journal:
+                for line in journal:
+                    try:
+                        self.enqueue(json.loads(line))
+                    except ValueError:
+                        # A partly written last line is discarded
+                        pass
+            os.remove(claimed_path)
+        self.rewrite_journal()
+
+    def enqueue(self, operation):
+        """
+        Add an operation to the queue and the pending reads
+        """
+        self.queue.append(operation)
+        if operation["op"] == "save":
+            self.pending[operation["row"][0]] = operation
+        else:
+            self.pending[operation["user_id"]] = operation
+
+    def record(self, operation):
+        """
+        Durably journal an operation then queue it
+        """
+        with self.lock:
+            self.enqueue(operation)
+            self.journal.write(json.dumps(operation) + "\n")
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+
+    def rewrite_journal(self):
+        """
+        Replace the journal with the operations still queued
+        """
+        files.atomic_write(self.journal_path, lambda journal: journal.write(
+            "".join(json.dumps(operation) + "\n" for operation in self.queue)))
+        # Appends must go to the new journal file
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = open(  # pylint: disable=consider-using-with
+            self.journal_path, "a", encoding="utf-8")
+
+    def questionnaire_rows(self):
+        with self.backend_lock:
+            return self.backend.questionnaire_rows()
+
+    def find_user(self, user_id):
+        with self.lock:
+            operation = self.pending.get(user_id)
+        if operation is not None:
+            if operation["op"] == "delete":
+                return None
+            return [str(value) for value in operation["row"]]
+        with self.backend_lock:
+            return self.backend.find_user(user_id)
+
+    def user_exists(self, user_id):
+        with self.lock:
+            operation = self.pending.get(user_id)
+        if operation is not None:
+            return operation["op"] == "save"
+        with self.backend_lock:
+            return self.backend.user_exists(user_id)
+
+    def count_users(self):
+        with self.lock:
+            pending = list(self.pending.items())
+        with self.backend_lock:
+            count = self.backend.count_users()
+            for user_id, operation in pending:
+                stored = self.backend.user_exists(user_id)
+                if operation["op"] == "save" and not stored:
+                    count += 1
+                elif operation["op"] == "delete" and stored:
+                    count -= 1
+        return count
+
+    def all_users(self):
+        with self.lock:
+            pending = dict(self.pending)
+        with self.backend_lock:
+            rows = [row for row in self.backend.all_users()
+                    if row[0] not in pending]
+        rows.extend([str(value) for value in operation["row"]]
+                    for operation in pending.values()
+                    if operation["op"] == "save")
+        return rows
+
+    def add_user(self, row):
+        self.record({"op": "save", "row": list(row)})
+
+    def update_user(self, row):
+        self.record({"op": "save", "row": list(row)})
+
+    def save_users(self, rows):
+        for row in rows:
+            self.record({"op": "save", "row": list(row)})
+
+    def delete_user(self, user_id):
+        self.record({"op": "delete", "user_id": user_id})
+
+    def apply(self, operation_type, operations):
+        """
+        Apply one batch of queued operations to the wrapped storage
+        """
+        with self.backend_lock:
+            if operation_type == "save":
+                latest = {}
+                for operation in operations:
+                    latest[operation["row"][0]] = operation["row"]
+                self.backend.save_users(list(latest.values()))
+            else:
+                self.backend.delete_user(operations[0]["user_id"])
+
+    def flush(self):
+        """
+        Apply everything queued so far to the wrapped storage in batches,
+        raising the error of the first batch that fails
+        """
+        with self.flush_lock:
+            with self.lock:
+                operations = list(self.queue)
+            for operation_type, batch in batches(operations):
+                self.apply(operation_type, batch)
+                with self.lock:
+                    del self.queue[:len(batch)]
+                    for operation in batch:
+                        key = (operation.get("user_id")
+                               or operation["row"][0])
+                        if self.pending.get(key) is operation:
+                            del self.pending[key]
+                    self.rewrite_journal()
+                    self.flushed.notify_all()
+
+    def run(self):
+        """
+        Flush the queue every interval, backing off exponentially while
+        storage is failing, for example when the quota is used up
+        """
+        run_with_backoff(self.flush, self.interval)
+
+    def close(self):
+        """
+        Make a last attempt to flush at exit, leaving anything that
+        fails in the journal for the next process to adopt
+        """
+        try:
+            self.flush()
+        except Exception:  # pylint: disable=broad-except
+            return
+        with self.lock:
+            if not self.queue:
+                self.journal.close()
+                os.remove(self.journal_path)
+
+    def wait_until_flushed(self, timeout=None):
+        """
+        Wait for the queue to empty, returning False on timeout
+        """
+        with self.lock:
+            return self.flushed.wait_for(lambda: not self.queue, timeout)